@@ -1,12 +1,18 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 import threading
 import subprocess
+import uuid
 import os
 import time
 import logging
 import traceback
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+from instawebhooks import Config, Monitor
+from instawebhooks import metrics
+from instawebhooks.subscriptions import parse_subscription
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -16,16 +22,36 @@ app_status = {
     "started_at": time.time(),
     "monitoring": False,
     "last_ping": None,
-    "monitor_instance": None,
     "last_error": None,
-    "process_pid": None
+    "last_check": None,
+    "posts_found": 0,
+    "posts_sent": 0
 }
 
+# Monitor działający w tym procesie (nie trafia do JSON-a z /debug)
+current_monitor = None
+monitor_thread = None
+# Stop zgłoszony zanim monitor powstał też go zatrzyma
+monitor_stop_requested = threading.Event()
+
+# Zadania diagnostyczne działają w tle, żeby żaden request nie blokował serwera
+jobs = {}
+jobs_lock = threading.Lock()
+job_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="job")
+# Restarty monitora nie czekają za diagnostyką i nie nakładają się na siebie
+control_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="control")
+MAX_JOBS = 50  # Tyle ostatnich zadań pamiętamy
+
+# Kursor i niewysłane wiadomości przetrwają restart monitora
+STATE_FILE = os.getenv('STATE_FILE', 'instawebhooks_state.json')
+OUTBOX_FILE = os.getenv('OUTBOX_FILE', 'instawebhooks_outbox.sqlite3')
+
 def run_simple_instagram_monitor():
-    """Prosta wersja monitoringu bez skomplikowanych modułów"""
-    global app_status
+    """Prosta wersja monitoringu uruchamiana w tym samym procesie"""
+    global app_status, current_monitor
     
     logging.info("=== URUCHAMIAM PROSTY MONITORING ===")
+    monitor = None
     
     try:
         # Sprawdź zmienne środowiskowe
@@ -50,81 +76,125 @@ def run_simple_instagram_monitor():
         # Zamień \n na prawdziwe nowe linie
         message_content = message_content.replace('\\n', '\n')
         
-        # Prosta komenda bez catchup
-        cmd = [
-            'python', '-m', 'instawebhooks',
-            instagram_username,
-            discord_webhook_url,
-            '-i', refresh_interval,
-            '-c', message_content,
-            '-v'
-        ]
+        # Konfiguracja monitora bez parsowania wiersza poleceń
+        config = Config(
+            refresh_interval=int(refresh_interval),
+            jitter=0.1,  # Rozsynchronizuj sprawdzanie między procesami
+            state_file=STATE_FILE,
+            outbox=OUTBOX_FILE
+        )
+        subscription = parse_subscription({
+            "instagram_username": instagram_username,
+            "discord_webhook_url": discord_webhook_url,
+            "message_content": message_content
+        })
+        monitor = Monitor(config, [subscription])
+        current_monitor = monitor
+        if monitor_stop_requested.is_set():
+            monitor.stop()
         
-        logging.info(f"Uruchamiam komendę: {' '.join(cmd)}")
-        app_status["monitoring"] = True
-        app_status["last_error"] = None
+        # Zdarzenia monitora zamiast parsowania logów
+        def on_post_detected(post, receivers):
+            app_status["posts_found"] += 1
+            logging.info(f"Nowy post: https://www.instagram.com/p/{post.shortcode}/")
         
-        # Uruchom proces
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
+        def on_post_delivered(entry):
+            app_status["posts_sent"] += 1
+            logging.info(f"🎉 Post wysłany: {entry.label}")
         
-        app_status["process_pid"] = process.pid
-        logging.info(f"Proces uruchomiony z PID: {process.pid}")
-        
-        # Czytaj output
-        line_count = 0
-        max_lines = 2000  # Zabezpieczenie
-        
-        while app_status["monitoring"] and process.poll() is None and line_count < max_lines:
-            try:
-                line = process.stdout.readline()
-                if line:
-                    line = line.strip()
-                    logging.info(f"InstaWebhooks: {line}")
-                    line_count += 1
-                    
-                    # Sprawdź czy są błędy
-                    if any(error in line.lower() for error in ['error', 'failed', 'exception']):
-                        logging.error(f"Błąd w InstaWebhooks: {line}")
-                        app_status["last_error"] = line
-                    
-                    # Sprawdź czy wysłano post
-                    if "sent to discord" in line.lower() or "sending post" in line.lower():
-                        logging.info(f"🎉 Post wysłany: {line}")
-                
-                time.sleep(0.1)
-                
-            except Exception as e:
-                logging.error(f"Błąd czytania output: {e}")
-                break
-        
-        # Sprawdź dlaczego się skończyło
-        if process.poll() is not None:
-            return_code = process.returncode
-            logging.info(f"Proces zakończony z kodem: {return_code}")
-            
-            if return_code != 0:
-                app_status["last_error"] = f"Process exited with code {return_code}"
+        def on_poll_finished(username, new_posts):
+            app_status["last_check"] = time.time()
+        
+        def on_error(source, error):
+            logging.error(f"Błąd w InstaWebhooks ({source}): {error}")
+            app_status["last_error"] = str(error)
+        
+        monitor.on_post_detected = on_post_detected
+        monitor.on_post_delivered = on_post_delivered
+        monitor.on_poll_finished = on_poll_finished
+        monitor.on_error = on_error
+        
+        app_status["monitoring"] = True
+        app_status["last_error"] = None
         
-        if line_count >= max_lines:
-            logging.warning("Osiągnięto maksymalną liczbę linii")
+        logging.info("Monitoring uruchomiony w tym procesie")
+        monitor.run_forever()
             
+    except ValueError as e:
+        logging.error(f"Błędna konfiguracja monitoringu: {e}")
+        app_status["last_error"] = f"Invalid configuration: {e}"
     except Exception as e:
         error_msg = f"Błąd monitoringu: {e}"
         logging.error(error_msg)
         logging.error(f"Traceback: {traceback.format_exc()}")
         app_status["last_error"] = str(e)
     finally:
-        app_status["monitoring"] = False
-        app_status["process_pid"] = None
+        # Po restarcie działa już nowy monitor - nie nadpisuj go
+        if current_monitor is monitor:
+            app_status["monitoring"] = False
+            current_monitor = None
         logging.info("Monitoring zakończony")
 
+def stop_current_monitor():
+    """Zatrzymaj działający monitor (bezpieczne z dowolnego wątku)"""
+    monitor_stop_requested.set()
+    monitor = current_monitor
+    if monitor is not None:
+        monitor.stop()
+
+def start_monitor_thread():
+    """Uruchom monitoring w osobnym wątku"""
+    global monitor_thread
+    monitor_stop_requested.clear()
+    monitor_thread = threading.Thread(target=run_simple_instagram_monitor, daemon=True)
+    monitor_thread.start()
+
+def run_job(job, func, args):
+    """Wykonuje zadanie i zapisuje jego wynik"""
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    try:
+        job["result"] = func(*args)
+        job["status"] = "finished"
+    except Exception as e:
+        logging.error(f"Błąd zadania {job['name']}: {e}")
+        job["error"] = str(e)
+        job["status"] = "failed"
+    finally:
+        job["finished_at"] = time.time()
+
+def start_job(name, func, *args, executor=job_executor):
+    """Dodaje zadanie do kolejki w tle i zwraca je od razu"""
+    job = {
+        "id": uuid.uuid4().hex,
+        "name": name,
+        "status": "queued",
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None
+    }
+    
+    with jobs_lock:
+        jobs[job["id"]] = job
+        # Usuń najstarsze zakończone zadania ponad limit
+        finished = [job_id for job_id, old in jobs.items() if old["finished_at"]]
+        for job_id in finished[:max(0, len(jobs) - MAX_JOBS)]:
+            del jobs[job_id]
+    
+    executor.submit(run_job, job, func, args)
+    return job
+
+def job_accepted(job):
+    """Odpowiedź 202 z ID zadania i adresem jego statusu"""
+    return jsonify({
+        "job_id": job["id"],
+        "name": job["name"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}"
+    }), 202
+
 @app.route('/')
 def home():
     instagram_username = os.getenv('INSTAGRAM_USERNAME', 'not_set')
@@ -135,8 +205,10 @@ def home():
         "uptime_seconds": int(time.time() - app_status["started_at"]),
         "monitoring": app_status["monitoring"],
         "instagram_user": instagram_username,
-        "process_pid": app_status["process_pid"],
         "last_error": app_status["last_error"],
+        "last_check": app_status["last_check"],
+        "posts_found": app_status["posts_found"],
+        "posts_sent": app_status["posts_sent"],
         "refresh_interval": os.getenv('REFRESH_INTERVAL', '300'),
         "message_content_set": bool(os.getenv('MESSAGE_CONTENT'))
     })
@@ -147,11 +219,34 @@ def health():
     app_status["last_ping"] = time.time()
     return "OK", 200
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metryki monitora dla Prometheusa (bez zapytań do bazy)"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/ping')
 def ping():
     """Alternatywny endpoint dla UptimeRobot"""
     return "pong", 200
 
+@app.route('/jobs')
+def list_jobs():
+    """Lista zadań w tle, bez wyników"""
+    with jobs_lock:
+        summary = [
+            {key: value for key, value in job.items() if key != "result"}
+            for job in jobs.values()
+        ]
+    return jsonify({"jobs": summary})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status i wynik zadania w tle"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
 @app.route('/debug')
 def debug():
     """Szczegółowe informacje debug"""
@@ -245,165 +340,119 @@ def test_instawebhooks():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/test-real-run')
-def test_real_run():
-    """Test rzeczywistego uruchomienia InstaWebhooks z timeoutem"""
+def run_cli(cmd, timeout):
+    """Uruchamia InstaWebhooks z wiersza poleceń i zwraca jego output"""
     try:
-        instagram_username = os.getenv('INSTAGRAM_USERNAME')
-        discord_webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
-        
-        if not instagram_username or not discord_webhook_url:
-            return jsonify({"error": "Missing env vars"}), 400
-        
-        # Bardzo prosta komenda - tylko sprawdź czy może się połączyć
-        cmd = [
-            'python', '-m', 'instawebhooks',
-            instagram_username,
-            discord_webhook_url,
-            '-i', '10',  # 10 sekund
-            '-v'
-        ]
-        
         result = subprocess.run(
             cmd,
             capture_output=True,
             text=True,
-            timeout=20  # 20 sekund timeout
+            timeout=timeout
         )
-        
-        return jsonify({
-            "command": ' '.join(cmd),
-            "returncode": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "success": result.returncode == 0
-        })
-        
     except subprocess.TimeoutExpired as e:
-        return jsonify({
-            "error": "Command timed out after 20 seconds",
+        # Przy timeoucie output przychodzi jako bajty
+        return {
+            "command": ' '.join(cmd),
+            "error": f"Command timed out after {timeout} seconds",
             "stdout": e.stdout.decode() if e.stdout else "",
             "stderr": e.stderr.decode() if e.stderr else "",
             "timeout": True
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        }
+    
+    return {
+        "command": ' '.join(cmd),
+        "returncode": result.returncode,
+        "stdout": result.stdout,
+        "stderr": result.stderr,
+        "success": result.returncode == 0
+    }
+
+def monitor_env():
+    """Zwraca nazwę użytkownika i webhook albo None, jeśli ich brakuje"""
+    instagram_username = os.getenv('INSTAGRAM_USERNAME')
+    discord_webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
+    
+    if not instagram_username or not discord_webhook_url:
+        return None
+    return instagram_username, discord_webhook_url
+
+@app.route('/test-real-run')
+def test_real_run():
+    """Test rzeczywistego uruchomienia InstaWebhooks z timeoutem (w tle)"""
+    env = monitor_env()
+    if not env:
+        return jsonify({"error": "Missing env vars"}), 400
+    
+    # Bardzo prosta komenda - tylko sprawdź czy może się połączyć
+    cmd = [
+        'python', '-m', 'instawebhooks',
+        *env,
+        '-i', '10',  # 10 sekund
+        '-v'
+    ]
+    
+    return job_accepted(start_job("test-real-run", run_cli, cmd, 20))  # 20 sekund timeout
+
+def force_check_job(posts, timeout):
+    """Wymusza sprawdzenie ostatnich postów przez osobny proces"""
+    instagram_username, discord_webhook_url = monitor_env()
+    cmd = [
+        'python', '-m', 'instawebhooks',
+        instagram_username,
+        discord_webhook_url,
+        '-i', '30',  # Krótki interval
+        '-p', str(posts),  # Ostatnie posty
+        '-c', '{owner_name} dodała nowy post na Instagramie\n{post_url}\n@everyone',
+        '-v'
+    ]
+    
+    result = run_cli(cmd, timeout)
+    result["note"] = f"Checking last {posts} posts with custom message format"
+    return result
 
 @app.route('/force-check')
 def force_check():
-    """Wymuś sprawdzenie nowych postów"""
-    try:
-        instagram_username = os.getenv('INSTAGRAM_USERNAME')
-        discord_webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
-        
-        if not instagram_username or not discord_webhook_url:
-            return jsonify({"error": "Missing env vars"}), 400
-        
-        # Sprawdź ostatnie 3 posty
-        cmd = [
-            'python', '-m', 'instawebhooks',
-            instagram_username,
-            discord_webhook_url,
-            '-i', '30',  # Krótki interval
-            '-p', '3',   # Ostatnie 3 posty
-            '-c', '{owner_name} dodała nowy post na Instagramie\n{post_url}\n@everyone',
-            '-v'
-        ]
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=45
-        )
-        
-        return jsonify({
-            "command": ' '.join(cmd),
-            "returncode": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "success": result.returncode == 0,
-            "note": "Checking last 3 posts with custom message format"
-        })
-        
-    except subprocess.TimeoutExpired as e:
-        return jsonify({
-            "error": "Command timed out",
-            "stdout": e.stdout.decode() if e.stdout else "",
-            "stderr": e.stderr.decode() if e.stderr else ""
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    """Wymuś sprawdzenie nowych postów (w tle)"""
+    if not monitor_env():
+        return jsonify({"error": "Missing env vars"}), 400
+    
+    # Sprawdź ostatnie 3 posty
+    return job_accepted(start_job("force-check", force_check_job, 3, 45))
 
 @app.route('/force-check-5')
 def force_check_5():
-    """Wymuś sprawdzenie ostatnich 5 postów"""
-    try:
-        instagram_username = os.getenv('INSTAGRAM_USERNAME')
-        discord_webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
-        
-        if not instagram_username or not discord_webhook_url:
-            return jsonify({"error": "Missing env vars"}), 400
-        
-        # Sprawdź ostatnie 5 postów - na pewno wyśle
-        cmd = [
-            'python', '-m', 'instawebhooks',
-            instagram_username,
-            discord_webhook_url,
-            '-i', '30',
-            '-p', '5',   # Ostatnie 5 postów
-            '-c', '{owner_name} dodała nowy post na Instagramie\n{post_url}\n@everyone',
-            '-v'
-        ]
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        
-        return jsonify({
-            "command": ' '.join(cmd),
-            "returncode": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "success": result.returncode == 0,
-            "note": "This will send last 5 posts - should definitely work!"
-        })
-        
-    except subprocess.TimeoutExpired as e:
-        return jsonify({
-            "error": "Command timed out",
-            "stdout": e.stdout.decode() if e.stdout else "",
-            "stderr": e.stderr.decode() if e.stderr else ""
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    """Wymuś sprawdzenie ostatnich 5 postów (w tle)"""
+    if not monitor_env():
+        return jsonify({"error": "Missing env vars"}), 400
+    
+    # Sprawdź ostatnie 5 postów - na pewno wyśle
+    return job_accepted(start_job("force-check-5", force_check_job, 5, 60))
+
+def restart_monitoring_job():
+    """Zatrzymuje monitor, czeka aż się skończy i uruchamia nowy"""
+    stop_current_monitor()
+    if monitor_thread is not None:
+        monitor_thread.join(timeout=30)
+        # Drugi monitor na tym samym webhooku wysyłałby posty podwójnie
+        if monitor_thread.is_alive():
+            raise RuntimeError("Previous monitor did not stop within 30 seconds")
+    
+    start_monitor_thread()
+    return {"message": "Monitoring restarted"}
 
 @app.route('/restart-monitoring')
 def restart_monitoring():
-    """Restart monitoringu"""
-    global app_status
-    
-    # Zatrzymaj obecny monitoring
-    app_status["monitoring"] = False
-    time.sleep(2)
-    
-    # Uruchom nowy wątek
-    monitor_thread = threading.Thread(target=run_simple_instagram_monitor, daemon=True)
-    monitor_thread.start()
-    
-    return jsonify({"message": "Monitoring restarted"})
+    """Restart monitoringu (w tle)"""
+    return job_accepted(start_job("restart-monitoring", restart_monitoring_job, executor=control_executor))
 
 @app.route('/stop-monitoring')
 def stop_monitoring():
     """Zatrzymaj monitoring"""
-    global app_status
-    app_status["monitoring"] = False
+    stop_current_monitor()
     return jsonify({"message": "Monitoring stopped"})
     
     
+
 @app.route('/send-test-post')
 def send_test_post():
     """Wyślij testowy post na Discord"""
@@ -446,84 +495,42 @@ def send_test_post():
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+def debug_verbose_job(cmd, timeout):
+    """Zbiera szczegółowy output InstaWebhooks przez zadany czas"""
+    start_time = time.time()
+    result = run_cli(cmd, timeout)
+    
+    return {
+        "command": result["command"],
+        "returncode": result.get("returncode"),
+        "output_lines": [f"STDOUT: {line}" for line in result["stdout"].splitlines()],
+        "error_lines": [f"STDERR: {line}" for line in result["stderr"].splitlines()],
+        "duration_seconds": int(time.time() - start_time),
+        "note": "Detailed output capture"
+    }
+
 @app.route('/debug-verbose')
 def debug_verbose():
-    """Bardzo szczegółowy debug InstaWebhooks"""
-    try:
-        instagram_username = os.getenv('INSTAGRAM_USERNAME')
-        discord_webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
-        
-        if not instagram_username or not discord_webhook_url:
-            return jsonify({"error": "Missing env vars"}), 400
-        
-        # Komenda z maksymalnym debugowaniem
-        cmd = [
-            'python', '-m', 'instawebhooks',
-            instagram_username,
-            discord_webhook_url,
-            '-i', '10',  # Bardzo krótki interval
-            '-p', '1',   # Tylko 1 post
-            '-v',        # Verbose
-            '-c', 'TEST: {owner_name} - {post_url}'
-        ]
-        
-        logging.info(f"Uruchamiam debug command: {' '.join(cmd)}")
-        
-        # Uruchom z real-time output
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-        
-        # Zbieraj output przez 30 sekund
-        output_lines = []
-        error_lines = []
-        start_time = time.time()
-        
-        while time.time() - start_time < 30:
-            # Sprawdź stdout
-            if process.stdout.readable():
-                line = process.stdout.readline()
-                if line:
-                    line = line.strip()
-                    output_lines.append(f"STDOUT: {line}")
-                    logging.info(f"Debug STDOUT: {line}")
-            
-            # Sprawdź stderr
-            if process.stderr.readable():
-                error_line = process.stderr.readline()
-                if error_line:
-                    error_line = error_line.strip()
-                    error_lines.append(f"STDERR: {error_line}")
-                    logging.error(f"Debug STDERR: {error_line}")
-            
-            # Sprawdź czy proces się skończył
-            if process.poll() is not None:
-                logging.info(f"Proces zakończony z kodem: {process.returncode}")
-                break
-            
-            time.sleep(0.1)
-        
-        # Zabij proces jeśli dalej działa
-        if process.poll() is None:
-            process.terminate()
-            process.wait(timeout=5)
-        
-        return jsonify({
-            "command": ' '.join(cmd),
-            "returncode": process.returncode,
-            "output_lines": output_lines,
-            "error_lines": error_lines,
-            "duration_seconds": int(time.time() - start_time),
-            "note": "Detailed real-time output capture"
-        })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    """Bardzo szczegółowy debug InstaWebhooks (w tle)"""
+    env = monitor_env()
+    if not env:
+        return jsonify({"error": "Missing env vars"}), 400
+    
+    # Komenda z maksymalnym debugowaniem
+    cmd = [
+        'python', '-m', 'instawebhooks',
+        *env,
+        '-i', '10',  # Bardzo krótki interval
+        '-p', '1',   # Tylko 1 post
+        '-v',        # Verbose
+        '-c', 'TEST: {owner_name} - {post_url}'
+    ]
+    
+    logging.info(f"Uruchamiam debug command: {' '.join(cmd)}")
+    
+    # Zbieraj output przez 30 sekund
+    return job_accepted(start_job("debug-verbose", debug_verbose_job, cmd, 30))
+
 
 @app.route('/test-instagram-access')
 def test_instagram_access():
@@ -597,8 +604,7 @@ if __name__ == '__main__':
         logging.info("Wszystkie wymagane zmienne środowiskowe są ustawione")
     
     # Uruchom monitoring w osobnym wątku
-    monitor_thread = threading.Thread(target=run_simple_instagram_monitor, daemon=True)
-    monitor_thread.start()
+    start_monitor_thread()
     
     # Uruchom serwer Flask
     port = int(os.environ.get('PORT', 10000))
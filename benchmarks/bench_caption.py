@@ -0,0 +1,78 @@
+"""Benchmark caption formatting against the old two regex passes.
+
+Run it from the repository root:
+
+    python benchmarks/bench_caption.py
+"""
+
+import random
+import re
+import string
+import timeit
+
+from instawebhooks.caption import format_caption
+
+CAPTIONS = 200
+CAPTION_LENGTH = 2000
+ROUNDS = 20
+
+
+def regex_passes(caption: str) -> str:
+    """Link a caption like create_embed did before the caption module"""
+
+    caption = re.sub(
+        r"#([a-zA-Z0-9]+\b)",
+        r"[#\1](https://www.instagram.com/explore/tags/\1)",
+        caption,
+    )
+    return re.sub(
+        r"@([a-zA-Z0-9_]+\b)",
+        r"[@\1](https://www.instagram.com/\1)",
+        caption,
+    )
+
+
+def random_caption(rng: random.Random, tag_ratio: float) -> str:
+    """Create a caption of words, with some of them hashtags or mentions"""
+
+    words = []
+    length = 0
+    while length < CAPTION_LENGTH:
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+        roll = rng.random()
+        if roll < tag_ratio / 2:
+            word = f"#{word}"
+        elif roll < tag_ratio:
+            word = f"@{word}"
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:CAPTION_LENGTH]
+
+
+def main():
+    rng = random.Random(0)
+    corpora = {
+        "typical": [random_caption(rng, 0.05) for _ in range(CAPTIONS)],
+        "hashtag-heavy": [random_caption(rng, 0.6) for _ in range(CAPTIONS)],
+    }
+
+    for corpus, captions in corpora.items():
+        for name, function in [
+            ("regex passes", regex_passes),
+            ("format_caption", format_caption),
+        ]:
+            seconds = min(
+                timeit.repeat(
+                    lambda function=function, captions=captions: [
+                        function(caption) for caption in captions
+                    ],
+                    number=ROUNDS,
+                    repeat=5,
+                )
+            )
+            per_caption = seconds / ROUNDS / len(captions) * 1e6
+            print(f"{corpus:>13} {name:>14}: {per_caption:.1f} us per caption")
+
+
+if __name__ == "__main__":
+    main()
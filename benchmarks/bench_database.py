@@ -0,0 +1,130 @@
+"""Benchmark recording sent posts in bulk against the old per-post calls.
+
+Run it from the repository root, it uses a temporary SQLite database:
+
+    python benchmarks/bench_database.py
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+POSTS = 500
+BATCH_SIZE = 10
+
+
+def post_data(index: int):
+    """Information of a sent post, as InstagramMonitor records it"""
+
+    shortcode = f"post{index:06d}"
+    return {
+        "username": "raenlua",
+        "shortcode": shortcode,
+        "url": f"https://www.instagram.com/p/{shortcode}/",
+        "owner_name": "Ryan Luu",
+        "owner_username": "raenlua",
+        "caption": "A sunny day at the beach #summer",
+        "image_url": f"https://www.instagram.com/p/{shortcode}/media",
+        "posted_at": datetime.now(timezone.utc),
+    }
+
+
+def record_one_by_one(manager, database, data):
+    """Record a post with a query per step, like the old three methods did"""
+
+    now = datetime.now(timezone.utc)
+    session = manager.get_session()
+    try:
+        session.query(database.InstagramPost).filter_by(
+            post_shortcode=data["shortcode"], sent_to_discord=True
+        ).first()
+    finally:
+        session.close()
+
+    session = manager.get_session()
+    try:
+        post = (
+            session.query(database.InstagramPost)
+            .filter_by(post_shortcode=data["shortcode"])
+            .first()
+        )
+        if post is None:
+            session.add(
+                database.InstagramPost(
+                    username=data["username"],
+                    post_shortcode=data["shortcode"],
+                    post_url=data["url"],
+                    owner_name=data["owner_name"],
+                    owner_username=data["owner_username"],
+                    post_caption=data["caption"],
+                    post_image_url=data["image_url"],
+                    posted_at=data["posted_at"],
+                    sent_to_discord=True,
+                    sent_at=now,
+                )
+            )
+        session.commit()
+    finally:
+        session.close()
+
+    session = manager.get_session()
+    try:
+        status = (
+            session.query(database.MonitoringStatus)
+            .filter_by(username=data["username"])
+            .first()
+        )
+        if status is None:
+            status = database.MonitoringStatus(username=data["username"])
+            session.add(status)
+        status.last_check = now
+        status.last_post_shortcode = data["shortcode"]
+        status.updated_at = now
+        session.commit()
+    finally:
+        session.close()
+
+
+def main():
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as directory:
+        # The database module reads its URL when it is imported
+        os.environ["DATABASE_URL"] = f"sqlite:///{directory}/bench.sqlite3"
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import database  # pylint: disable=import-outside-toplevel
+
+        manager = database.db_manager
+        posts = [post_data(index) for index in range(3 * POSTS)]
+        old, single, batched = posts[:POSTS], posts[POSTS:-POSTS], posts[-POSTS:]
+
+        def one_by_one():
+            for data in old:
+                record_one_by_one(manager, database, data)
+
+        def record_each():
+            for data in single:
+                manager.record_posts(data["username"], [data], data["shortcode"])
+
+        def record_batches():
+            for start in range(0, POSTS, BATCH_SIZE):
+                batch = batched[start : start + BATCH_SIZE]
+                manager.record_posts("raenlua", batch, batch[-1]["shortcode"])
+
+        for name, function in [
+            ("three calls per post", one_by_one),
+            ("record_posts per post", record_each),
+            (f"batches of {BATCH_SIZE}", record_batches),
+        ]:
+            started = time.perf_counter()
+            function()
+            seconds = time.perf_counter() - started
+            print(f"{name:>21}: {seconds / POSTS * 1000:.2f} ms per post")
+
+        manager.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
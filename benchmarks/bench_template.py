@@ -0,0 +1,57 @@
+"""Benchmark compiled message templates against the old replace loop.
+
+Run it from the repository root:
+
+    python benchmarks/bench_template.py
+"""
+
+import timeit
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from instawebhooks.template import compile_template
+
+TEMPLATE = "{owner_name} posted on Instagram\n{post_url}\n{post_caption}\n@everyone"
+ROUNDS = 100_000
+
+
+def replace_loop(template: str, post) -> str:
+    """Render a template like format_message did before templates were compiled"""
+
+    placeholders = {
+        "{post_url}": f"https://www.instagram.com/p/{post.shortcode}/",
+        "{owner_url}": f"https://www.instagram.com/{post.owner_username}/",
+        "{owner_name}": post.owner_profile.full_name,
+        "{owner_username}": post.owner_username,
+        "{post_caption}": post.caption or "",
+        "{post_shortcode}": post.shortcode,
+        "{post_image_url}": post.url,
+    }
+    for placeholder, value in placeholders.items():
+        template = template.replace(placeholder, value)
+    return template
+
+
+def main():
+    post = SimpleNamespace(
+        shortcode="C8wRGmyR-6N",
+        owner_username="raenlua",
+        owner_profile=SimpleNamespace(full_name="Ryan Luu"),
+        caption="A sunny day at the beach #summer @raenlua",
+        url="https://www.instagram.com/p/C8wRGmyR-6N/media",
+        date_utc=datetime(2024, 7, 1, 18, 30, tzinfo=timezone.utc),
+        typename="GraphImage",
+    )
+    render = compile_template(TEMPLATE)
+    assert render(post) == replace_loop(TEMPLATE, post)
+
+    for name, function in [
+        ("replace loop", lambda: replace_loop(TEMPLATE, post)),
+        ("compiled template", lambda: render(post)),
+    ]:
+        seconds = min(timeit.repeat(function, number=ROUNDS, repeat=5))
+        print(f"{name:>18}: {seconds / ROUNDS * 1e6:.2f} us per post")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import os
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Boolean, Text
+from sqlalchemy import create_engine, func, select, Column, String, DateTime, Integer, Boolean, Text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
@@ -12,6 +15,14 @@ if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
     # Render używa postgres://, ale SQLAlchemy potrzebuje postgresql://
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
+# Pula połączeń - jedno połączenie jest używane ponownie zamiast otwierania nowego
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+# Liczba ostatnio wysłanych postów każdego konta trzymanych w pamięci
+SEEN_INDEX_SIZE = int(os.getenv('SEEN_INDEX_SIZE', '1000'))
+
 Base = declarative_base()
 
 class InstagramPost(Base):
@@ -40,10 +51,46 @@ class MonitoringStatus(Base):
     is_active = Column(Boolean, default=True)
     updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
+class SeenPostIndex:
+    """Indeks ostatnio wysłanych postów każdego konta w pamięci
+    
+    Każde konto trzyma najwyżej max_per_account shortcode'ów, a najdawniej
+    używane są usuwane jako pierwsze. Indeks zna tylko wysłane posty, więc
+    brak w indeksie oznacza, że trzeba zapytać bazę danych.
+    """
+    
+    def __init__(self, max_per_account=SEEN_INDEX_SIZE):
+        self.max_per_account = max_per_account
+        self._accounts = {}
+        self._lock = threading.Lock()
+    
+    def add(self, username, shortcode):
+        """Dodaje wysłany post do indeksu"""
+        with self._lock:
+            shortcodes = self._accounts.setdefault(username, OrderedDict())
+            shortcodes[shortcode] = None
+            shortcodes.move_to_end(shortcode)
+            while len(shortcodes) > self.max_per_account:
+                shortcodes.popitem(last=False)
+    
+    def contains(self, shortcode, username=None):
+        """Sprawdza czy post jest w indeksie, opcjonalnie tylko dla jednego konta"""
+        with self._lock:
+            if username is None:
+                accounts = list(self._accounts.values())
+            else:
+                accounts = [self._accounts[username]] if username in self._accounts else []
+            for shortcodes in accounts:
+                if shortcode in shortcodes:
+                    shortcodes.move_to_end(shortcode)
+                    return True
+            return False
+
 class DatabaseManager:
     def __init__(self):
         self.engine = None
         self.SessionLocal = None
+        self.seen = SeenPostIndex()
         self.setup_database()
     
     def setup_database(self):
@@ -53,13 +100,23 @@ class DatabaseManager:
             return
         
         try:
-            self.engine = create_engine(DATABASE_URL, echo=False)
+            # pre_ping odrzuca zerwane połączenia z puli zanim zostaną użyte
+            options = {'echo': False, 'pool_pre_ping': True}
+            if not DATABASE_URL.startswith('sqlite'):
+                options.update(
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_recycle=DB_POOL_RECYCLE,
+                )
+            self.engine = create_engine(DATABASE_URL, **options)
             self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
             
             # Stwórz tabele jeśli nie istnieją
             Base.metadata.create_all(bind=self.engine)
             logging.info("Połączono z bazą danych PostgreSQL")
             
+            self.warm_seen_index()
+            
         except Exception as e:
             logging.error(f"Błąd połączenia z bazą danych: {e}")
             self.engine = None
@@ -71,108 +128,171 @@ class DatabaseManager:
             return self.SessionLocal()
         return None
     
-    def is_post_sent(self, shortcode):
-        """Sprawdza czy post został już wysłany"""
-        if not self.SessionLocal:
-            return False
+    def _insert(self, table):
+        """Zwraca INSERT obsługujący ON CONFLICT dla używanej bazy danych
+        
+        PostgreSQL jest używany na produkcji, a SQLite lokalnie.
+        """
+        if self.engine.dialect.name == 'postgresql':
+            return postgresql.insert(table)
+        return sqlite.insert(table)
+    
+    def warm_seen_index(self):
+        """Wczytuje ostatnio wysłane posty każdego konta do indeksu w pamięci"""
+        ranked = select(
+            InstagramPost.username,
+            InstagramPost.post_shortcode,
+            func.row_number().over(
+                partition_by=InstagramPost.username,
+                order_by=InstagramPost.sent_at.desc()
+            ).label('rank')
+        ).where(InstagramPost.sent_to_discord.is_(True)).subquery()
+        
+        # Najnowsze posty są dodawane na końcu, więc zostają w indeksie najdłużej
+        query = select(ranked.c.username, ranked.c.post_shortcode).where(
+            ranked.c.rank <= self.seen.max_per_account
+        ).order_by(ranked.c.rank.desc())
         
-        session = self.get_session()
         try:
-            post = session.query(InstagramPost).filter_by(
-                post_shortcode=shortcode,
-                sent_to_discord=True
-            ).first()
-            return post is not None
+            with self.engine.connect() as connection:
+                count = 0
+                for username, shortcode in connection.execute(query):
+                    self.seen.add(username, shortcode)
+                    count += 1
+            logging.info(f"Wczytano {count} wysłanych postów do indeksu")
         except SQLAlchemyError as e:
-            logging.error(f"Błąd sprawdzania posta: {e}")
-            return False
-        finally:
-            session.close()
+            logging.error(f"Błąd wczytywania indeksu postów: {e}")
     
-    def save_post(self, post_data):
-        """Zapisuje informacje o poście"""
-        if not self.SessionLocal:
-            logging.warning("Brak połączenia z bazą - nie zapisuję posta")
+    def sent_shortcodes(self, shortcodes, username=None):
+        """Zwraca shortcode'y postów, które zostały już wysłane
+        
+        Najpierw sprawdzany jest indeks w pamięci, a o pozostałe posty baza
+        danych jest pytana jednym zapytaniem.
+        """
+        shortcodes = list(shortcodes)
+        sent = {shortcode for shortcode in shortcodes if self.seen.contains(shortcode, username)}
+        missing = [shortcode for shortcode in shortcodes if shortcode not in sent]
+        if not self.engine or not missing:
+            return sent
+        
+        query = select(InstagramPost.username, InstagramPost.post_shortcode).where(
+            InstagramPost.post_shortcode.in_(missing),
+            InstagramPost.sent_to_discord.is_(True)
+        )
+        try:
+            with self.engine.connect() as connection:
+                for post_username, shortcode in connection.execute(query):
+                    self.seen.add(post_username, shortcode)
+                    sent.add(shortcode)
+        except SQLAlchemyError as e:
+            logging.error(f"Błąd sprawdzania postów: {e}")
+        return sent
+    
+    def is_post_sent(self, shortcode, username=None):
+        """Sprawdza czy post został już wysłany"""
+        return shortcode in self.sent_shortcodes([shortcode], username)
+    
+    def record_posts(self, username, posts, last_shortcode=None, update_status=True):
+        """Zapisuje wysłane posty i status monitorowania w jednej transakcji
+        
+        Posty są zapisywane jednym INSERT ... ON CONFLICT, więc nie trzeba
+        najpierw sprawdzać, czy już istnieją.
+        """
+        if not self.engine:
+            if posts:
+                logging.warning("Brak połączenia z bazą - nie zapisuję postów")
             return False
         
-        session = self.get_session()
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                'username': post_data['username'],
+                'post_shortcode': post_data['shortcode'],
+                'post_url': post_data['url'],
+                'owner_name': post_data.get('owner_name', ''),
+                'owner_username': post_data.get('owner_username', ''),
+                'post_caption': post_data.get('caption', ''),
+                'post_image_url': post_data.get('image_url', ''),
+                'posted_at': post_data.get('posted_at'),
+                'sent_to_discord': True,
+                'sent_at': now,
+                'created_at': now,
+            }
+            for post_data in posts
+        ]
+        
+        status = {'username': username, 'last_check': now, 'updated_at': now}
+        if last_shortcode:
+            status['last_post_shortcode'] = last_shortcode
+        
         try:
-            # Sprawdź czy post już istnieje
-            existing_post = session.query(InstagramPost).filter_by(
-                post_shortcode=post_data['shortcode']
-            ).first()
-            
-            if existing_post:
-                # Aktualizuj istniejący post
-                existing_post.sent_to_discord = True
-                existing_post.sent_at = datetime.now(timezone.utc)
-            else:
-                # Stwórz nowy post
-                new_post = InstagramPost(
-                    username=post_data['username'],
-                    post_shortcode=post_data['shortcode'],
-                    post_url=post_data['url'],
-                    owner_name=post_data.get('owner_name', ''),
-                    owner_username=post_data.get('owner_username', ''),
-                    post_caption=post_data.get('caption', ''),
-                    post_image_url=post_data.get('image_url', ''),
-                    posted_at=post_data.get('posted_at'),
-                    sent_to_discord=True,
-                    sent_at=datetime.now(timezone.utc)
-                )
-                session.add(new_post)
+            with self.engine.begin() as connection:
+                if rows:
+                    insert = self._insert(InstagramPost.__table__)
+                    connection.execute(
+                        insert.on_conflict_do_update(
+                            index_elements=['post_shortcode'],
+                            set_={
+                                'sent_to_discord': True,
+                                'sent_at': insert.excluded.sent_at,
+                            },
+                        ),
+                        rows
+                    )
+                
+                if update_status:
+                    insert = self._insert(MonitoringStatus.__table__).values(**status)
+                    connection.execute(
+                        insert.on_conflict_do_update(
+                            index_elements=['username'],
+                            set_={key: value for key, value in status.items() if key != 'username'},
+                        )
+                    )
             
-            session.commit()
-            logging.info(f"Zapisano post {post_data['shortcode']} do bazy")
+            for row in rows:
+                self.seen.add(row['username'], row['post_shortcode'])
+                logging.info(f"Zapisano post {row['post_shortcode']} do bazy")
             return True
             
         except SQLAlchemyError as e:
-            logging.error(f"Błąd zapisywania posta: {e}")
-            session.rollback()
+            logging.error(f"Błąd zapisywania postów: {e}")
             return False
-        finally:
-            session.close()
+    
+    def save_post(self, post_data):
+        """Zapisuje informacje o poście"""
+        return self.record_posts(post_data['username'], [post_data], update_status=False)
     
     def update_monitoring_status(self, username, last_shortcode=None):
         """Aktualizuje status monitorowania"""
+        self.record_posts(username, [], last_shortcode)
+    
+    def get_last_post_shortcode(self, username):
+        """Pobiera shortcode ostatniego posta"""
         if not self.SessionLocal:
-            return
+            return None
         
         session = self.get_session()
         try:
             status = session.query(MonitoringStatus).filter_by(username=username).first()
-            
-            if status:
-                status.last_check = datetime.now(timezone.utc)
-                if last_shortcode:
-                    status.last_post_shortcode = last_shortcode
-                status.updated_at = datetime.now(timezone.utc)
-            else:
-                status = MonitoringStatus(
-                    username=username,
-                    last_check=datetime.now(timezone.utc),
-                    last_post_shortcode=last_shortcode,
-                    updated_at=datetime.now(timezone.utc)
-                )
-                session.add(status)
-            
-            session.commit()
-            
+            return status.last_post_shortcode if status else None
         except SQLAlchemyError as e:
-            logging.error(f"Błąd aktualizacji statusu: {e}")
-            session.rollback()
+            logging.error(f"Błąd pobierania ostatniego posta: {e}")
+            return None
         finally:
             session.close()
     
-    def get_last_post_shortcode(self, username):
-        """Pobiera shortcode ostatniego posta"""
+    def get_last_post(self, username):
+        """Pobiera shortcode i datę najnowszego zapisanego posta"""
         if not self.SessionLocal:
             return None
         
         session = self.get_session()
         try:
-            status = session.query(MonitoringStatus).filter_by(username=username).first()
-            return status.last_post_shortcode if status else None
+            post = session.query(InstagramPost).filter(
+                InstagramPost.username == username,
+                InstagramPost.posted_at.isnot(None)
+            ).order_by(InstagramPost.posted_at.desc()).first()
+            return (post.post_shortcode, post.posted_at) if post else None
         except SQLAlchemyError as e:
             logging.error(f"Błąd pobierania ostatniego posta: {e}")
             return None
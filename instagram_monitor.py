@@ -1,10 +1,15 @@
-import subprocess
 import logging
-import time
-import re
 import os
-from datetime import datetime, timezone
+from datetime import timezone
+
 from database import db_manager
+from instawebhooks import Config, Monitor, create_loader, login
+from instawebhooks.state import Cursor
+from instawebhooks.subscriptions import parse_subscription
+
+# Kursor i niewysłane wiadomości przetrwają restart monitora
+STATE_FILE = os.getenv('STATE_FILE', 'instawebhooks_state.json')
+OUTBOX_FILE = os.getenv('OUTBOX_FILE', 'instawebhooks_outbox.sqlite3')
 
 class InstagramMonitor:
     def __init__(self, username, webhook_url, refresh_interval=3600, message_content=""):
@@ -13,40 +18,34 @@ class InstagramMonitor:
         self.refresh_interval = refresh_interval
         self.message_content = message_content
         self.is_running = False
+        self.monitor = None
     
-    def extract_post_info_from_log(self, log_line):
-        """Wyciąga informacje o poście z logów InstaWebhooks"""
-        url_pattern = r'https://www\.instagram\.com/p/([A-Za-z0-9_-]+)/'
-        match = re.search(url_pattern, log_line)
-        
-        if match:
-            shortcode = match.group(1)
-            return {
-                'username': self.username,
-                'shortcode': shortcode,
-                'url': f"https://www.instagram.com/p/{shortcode}/",
-                'posted_at': datetime.now(timezone.utc)
-            }
-        return None
+    def post_info(self, post):
+        """Zbiera informacje o poście do zapisania w bazie"""
+        return {
+            'username': self.username,
+            'shortcode': post.shortcode,
+            'url': f"https://www.instagram.com/p/{post.shortcode}/",
+            'owner_name': post.owner_profile.full_name,
+            'owner_username': post.owner_username,
+            'caption': post.caption or '',
+            'image_url': post.url,
+            'posted_at': post.date_utc.replace(tzinfo=timezone.utc)
+        }
     
     def run_with_database_tracking(self):
-        """Uruchamia InstaWebhooks z śledzeniem w bazie danych"""
-        cmd = [
-            'python', '-m', 'instawebhooks',
-            self.username,
-            self.webhook_url,
-            '-i', str(self.refresh_interval),
-            '-v'
-        ]
+        """Uruchamia InstaWebhooks w tym procesie z śledzeniem w bazie danych"""
+        config = Config(
+            refresh_interval=int(self.refresh_interval),
+            jitter=0.1,  # Rozsynchronizuj sprawdzanie między procesami
+            state_file=STATE_FILE,
+            outbox=OUTBOX_FILE
+        )
         
         # Sprawdź czy mamy ostatni post w bazie
         last_shortcode = db_manager.get_last_post_shortcode(self.username)
         logging.info(f"Ostatni post w bazie: {last_shortcode}")
         
-        if not last_shortcode:
-            cmd.extend(['-p', '1'])
-            logging.info("Dodano -p 1 (catchup)")
-        
         # Ustaw custom message content
         message_template = os.getenv('MESSAGE_CONTENT', '')
         
@@ -61,105 +60,99 @@ class InstagramMonitor:
         message_template = message_template.replace('\\n', '\n')
         
         logging.info(f"Message template: {repr(message_template)}")
-        cmd.extend(['-c', message_template])
         
         # Dodaj logowanie jeśli są dane
         instagram_login = os.getenv('INSTAGRAM_LOGIN')
         instagram_password = os.getenv('INSTAGRAM_PASSWORD')
         
         if instagram_login and instagram_password:
-            cmd.extend(['-l', instagram_login, instagram_password])
-            logging.info("Dodano dane logowania Instagram")
+            logging.info("Zaloguję się do Instagrama")
         
-        logging.info(f"Pełna komenda: {cmd}")
         self.is_running = True
         
         try:
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,  # Oddzielny stderr
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
+            subscription = parse_subscription({
+                'instagram_username': self.username,
+                'discord_webhook_url': self.webhook_url,
+                'message_content': message_template
+            })
+            
+            loader = create_loader()
+            if instagram_login and instagram_password:
+                login(loader, instagram_login, instagram_password)
             
-            logging.info(f"Proces uruchomiony, PID: {process.pid}")
+            self.monitor = Monitor(config, [subscription], loader)
             
-            # Czytaj stdout i stderr
-            import select
-            import sys
+            # Bez pliku stanu zacznij od ostatniego posta z bazy, żeby nie
+            # pominąć postów dodanych w trakcie przerwy
+            if self.monitor.cursors.get(subscription.key) is None:
+                last_post = db_manager.get_last_post(self.username)
+                if last_post:
+                    shortcode, posted_at = last_post
+                    if posted_at.tzinfo is None:
+                        posted_at = posted_at.replace(tzinfo=timezone.utc)
+                    self.monitor.cursors.advance(
+                        subscription.key, Cursor(shortcode, posted_at.timestamp())
+                    )
+                    logging.info(f"Kursor z bazy: {shortcode}")
+                elif not last_shortcode:
+                    config.catchup = 1
+                    logging.info("Wyślę ostatni post (catchup)")
             
-            line_count = 0
-            max_lines = 1000  # Zabezpieczenie przed nieskończoną pętlą
+            # Posty czekające na wysłanie, zapisywane do bazy po dostarczeniu
+            detected = {}
             
-            while self.is_running and process.poll() is None and line_count < max_lines:
-                # Sprawdź czy są dane do odczytu
-                ready, _, _ = select.select([process.stdout, process.stderr], [], [], 1.0)
-                
-                if process.stdout in ready:
-                    line = process.stdout.readline()
-                    if line:
-                        line = line.strip()
-                        logging.info(f"InstaWebhooks STDOUT: {line}")
-                        line_count += 1
-                        
-                        # Sprawdź czy wysłano post
-                        if "Sending post" in line or "sent to Discord" in line:
-                            post_info = self.extract_post_info_from_log(line)
-                            if post_info:
-                                if not db_manager.is_post_sent(post_info['shortcode']):
-                                    db_manager.save_post(post_info)
-                                    db_manager.update_monitoring_status(
-                                        self.username, 
-                                        post_info['shortcode']
-                                    )
-                                    logging.info(f"Zapisano nowy post {post_info['shortcode']} do bazy")
-                        
-                        # Aktualizuj status monitorowania
-                        if "Checking for new posts" in line:
-                            db_manager.update_monitoring_status(self.username)
-                
-                if process.stderr in ready:
-                    error_line = process.stderr.readline()
-                    if error_line:
-                        error_line = error_line.strip()
-                        logging.error(f"InstaWebhooks STDERR: {error_line}")
-                        line_count += 1
-                
-                # Sprawdź czy proces się zakończył
-                if process.poll() is not None:
-                    logging.info(f"Proces zakończony z kodem: {process.returncode}")
-                    break
-                
-                time.sleep(0.1)
+            def on_post_detected(post, receivers):
+                detected[post.shortcode] = self.post_info(post)
             
-            # Przeczytaj pozostałe linie
-            remaining_stdout, remaining_stderr = process.communicate(timeout=5)
+            def on_posts_delivered(entries):
+                # Wszystkie posty z jednej rundy wysyłki zapisuje jedna transakcja
+                posts = [detected.pop(entry.label, None) for entry in entries]
+                posts = [post_info for post_info in posts if post_info]
+                if posts:
+                    self.record_posts(posts)
             
-            if remaining_stdout:
-                logging.info(f"Pozostały STDOUT: {remaining_stdout}")
-            if remaining_stderr:
-                logging.error(f"Pozostały STDERR: {remaining_stderr}")
+            def on_poll_finished(username, new_posts):
+                # Status zapisuje się razem z postami, więc tylko gdy ich nie ma
+                if not new_posts:
+                    self.record_posts([])
             
-            logging.info(f"Proces zakończony. Return code: {process.returncode}")
+            def on_error(source, error):
+                logging.error(f"Błąd InstaWebhooks ({source}): {error}")
             
+            self.monitor.on_post_detected = on_post_detected
+            self.monitor.on_posts_delivered = on_posts_delivered
+            self.monitor.on_poll_finished = on_poll_finished
+            self.monitor.on_error = on_error
+            
+            # Stop mógł przyjść w trakcie logowania
+            if self.is_running:
+                logging.info("Uruchamiam monitor w tym procesie")
+                self.monitor.run_forever()
+            
+        except ValueError as e:
+            logging.error(f"Błędna konfiguracja InstaWebhooks: {e}")
         except Exception as e:
             logging.error(f"Błąd podczas monitorowania: {e}")
             import traceback
             logging.error(f"Traceback: {traceback.format_exc()}")
         finally:
             self.is_running = False
-            if 'process' in locals() and process.poll() is None:
-                logging.info("Kończę proces...")
-                process.terminate()
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    logging.warning("Proces nie zakończył się, wymuszam...")
-                    process.kill()
+            self.monitor = None
+    
+    def record_posts(self, posts):
+        """Zapisuje nowe posty i status monitorowania jedną transakcją"""
+        # Upsert pomija posty zapisane wcześniej, więc nie trzeba ich sprawdzać
+        last_shortcode = posts[-1]['shortcode'] if posts else None
+        
+        if db_manager.record_posts(self.username, posts, last_shortcode):
+            for post in posts:
+                logging.info(f"Zapisano nowy post {post['shortcode']} do bazy")
     
     def stop(self):
         """Zatrzymuje monitoring"""
         self.is_running = False
+        monitor = self.monitor
+        if monitor is not None:
+            monitor.stop()
         logging.info("Otrzymano sygnał stop")
\ No newline at end of file
@@ -1,11 +1,28 @@
-"""Initalizer module for pointing towards main module."""
+"""InstaWebhooks sends new Instagram posts to Discord webhooks."""
 
-import sys
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .config import Config
+    from .monitor import Monitor, create_loader, login
+    from .subscriptions import Subscription
 
 __version__ = "0.1.4"
 
+# Public API, imported on first use so importing the package stays cheap
+_EXPORTS = {
+    "Config": ".config",
+    "Monitor": ".monitor",
+    "Subscription": ".subscriptions",
+    "create_loader": ".monitor",
+    "login": ".monitor",
+}
+
+__all__ = list(_EXPORTS)
 
-if __name__ == "__main__":
-    from instawebhooks.__main__ import main
 
-    sys.exit(main())
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
@@ -0,0 +1,174 @@
+"""Ordered delivery of webhook messages, with optional batching."""
+
+import asyncio
+import hashlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import ClientSession
+
+from .ratelimit import RateLimiter
+from .webhook import Attachment, Message, execute_webhook
+
+# Limits of a single Discord webhook message
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBEDS = 10
+MAX_EMBED_CHARACTERS = 6000
+MAX_ATTACHMENTS = 10
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+
+def embed_characters(embed: Dict[str, Any]) -> int:
+    """Count the characters of an embed that Discord limits"""
+
+    count = len(embed.get("title", "")) + len(embed.get("description", ""))
+    count += len(embed.get("footer", {}).get("text", ""))
+    count += len(embed.get("author", {}).get("name", ""))
+    for field in embed.get("fields", []):
+        count += len(field.get("name", "")) + len(field.get("value", ""))
+    return count
+
+
+def fits_in_one_message(messages: Sequence[Message]) -> bool:
+    """Check if messages can be merged without going over Discord's limits"""
+
+    contents = [message.content for message in messages if message.content]
+    embeds = [embed for message in messages for embed in message.embeds]
+    attachments = [file for message in messages for file in message.attachments]
+
+    return (
+        len("\n".join(contents)) <= MAX_CONTENT_LENGTH
+        and len(embeds) <= MAX_EMBEDS
+        and sum(embed_characters(embed) for embed in embeds) <= MAX_EMBED_CHARACTERS
+        and len(attachments) <= MAX_ATTACHMENTS
+        and sum(len(data) for _, data in attachments) <= MAX_UPLOAD_SIZE
+    )
+
+
+def _rename_attachments(value: Any, renames: Dict[str, str]) -> Any:
+    """Point the attachment URLs of an embed at renamed attachments"""
+
+    if isinstance(value, dict):
+        return {key: _rename_attachments(item, renames) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rename_attachments(item, renames) for item in value]
+    if isinstance(value, str) and value.startswith("attachment://"):
+        filename = value[len("attachment://") :]
+        return f"attachment://{renames.get(filename, filename)}"
+    return value
+
+
+def merge_messages(messages: Sequence[Message]) -> Message:
+    """Merge messages into one, keeping their order
+
+    Attachments are renamed so the files of different posts do not collide,
+    and identical files, such as the profile picture of an account, are only
+    uploaded once.
+    """
+
+    if len(messages) == 1:
+        return messages[0]
+
+    embeds: List[Dict[str, Any]] = []
+    attachments: List[Attachment] = []
+    uploaded: Dict[str, str] = {}
+
+    for index, message in enumerate(messages):
+        renames: Dict[str, str] = {}
+        for filename, data in message.attachments:
+            digest = hashlib.sha256(data).hexdigest()
+            if digest not in uploaded:
+                uploaded[digest] = f"{index}_{filename}"
+                attachments.append((uploaded[digest], data))
+            renames[filename] = uploaded[digest]
+        embeds.extend(_rename_attachments(embed, renames) for embed in message.embeds)
+
+    content = "\n".join(message.content for message in messages if message.content)
+    return Message(content, embeds, attachments)
+
+
+class WebhookBatcher:
+    """Send messages to each webhook in order, merging queued ones if enabled
+
+    Every webhook has its own queue and worker, so a slow webhook never holds
+    up the others. With a batch delay, the worker waits that long for more
+    messages and then sends the queue in as few requests as Discord's limits
+    allow. When a request fails, the messages queued after it are cancelled
+    instead of being sent out of order.
+    """
+
+    def __init__(
+        self,
+        session: ClientSession,
+        rate_limiter: Optional[RateLimiter] = None,
+        batch_delay: Optional[float] = None,
+    ):
+        self.session = session
+        self.rate_limiter = rate_limiter
+        self.batch_delay = batch_delay
+        self._queues: Dict[str, Deque[Tuple[Message, "asyncio.Future[None]"]]] = {}
+        self._workers: Dict[str, "asyncio.Task[None]"] = {}
+
+    def submit(self, url: str, message: Message) -> "asyncio.Future[None]":
+        """Queue a message, returning a future that is done once it was sent"""
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(url, deque()).append((message, future))
+        if url not in self._workers:
+            self._workers[url] = asyncio.ensure_future(self._work(url))
+        return future
+
+    def close(self):
+        """Stop sending, cancelling every message still queued"""
+
+        for worker in list(self._workers.values()):
+            worker.cancel()
+
+    def _next_batch(self, queue: Deque[Tuple[Message, "asyncio.Future[None]"]]):
+        """Take the next messages to send in one request from a queue"""
+
+        batch = [queue.popleft()]
+        while (
+            self.batch_delay is not None
+            and queue
+            and fits_in_one_message([message for message, _ in batch] + [queue[0][0]])
+        ):
+            batch.append(queue.popleft())
+        return batch
+
+    async def _work(self, url: str):
+        """Send the queued messages of a webhook until its queue is empty"""
+
+        queue = self._queues[url]
+        batch: List[Tuple[Message, "asyncio.Future[None]"]] = []
+        try:
+            if self.batch_delay:
+                await asyncio.sleep(self.batch_delay)
+
+            while queue:
+                batch = self._next_batch(queue)
+                try:
+                    await execute_webhook(
+                        self.session,
+                        url,
+                        merge_messages([message for message, _ in batch]),
+                        self.rate_limiter,
+                    )
+                except Exception as exc:  # pylint: disable=broad-exception-caught
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(exc)
+
+                    # Never let later messages overtake the failed ones
+                    for _, future in queue:
+                        future.cancel()
+                    queue.clear()
+                else:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            del self._workers[url]
+            for _, future in [*batch, *queue]:
+                future.cancel()
+            queue.clear()
@@ -0,0 +1,66 @@
+"""Circuit breakers for backing off from Instagram after errors."""
+
+import random
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Circuit breaker with exponential backoff and half-open probing
+
+    After a failure the breaker opens and rejects calls until its backoff has
+    passed, doubling the backoff with every consecutive failure. It then lets
+    a single probe call through; a success closes the breaker again while a
+    failure reopens it with a longer backoff.
+    """
+
+    def __init__(self, base_delay: float = 60, max_delay: float = 3600):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.state = CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+
+    def ready(self) -> bool:
+        """Check if a call would be let through, without changing the state"""
+
+        return self.state == CLOSED or time.monotonic() >= self.open_until
+
+    def allow(self) -> bool:
+        """Check if a call may be made now, letting a single probe through"""
+
+        if self.state == CLOSED:
+            return True
+        if not self.ready():
+            return False
+
+        # Allow another probe if this one never reports back
+        self.state = HALF_OPEN
+        self.open_until = time.monotonic() + self.base_delay
+        return True
+
+    def retry_after(self) -> float:
+        """Get the time in seconds until the breaker lets a call through"""
+
+        if self.state == CLOSED:
+            return 0.0
+        return max(self.open_until - time.monotonic(), 0.0)
+
+    def record_success(self):
+        """Close the breaker after a successful call"""
+
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        """Open the breaker after a failed call"""
+
+        self.failures += 1
+        delay = min(self.base_delay * 2 ** (self.failures - 1), self.max_delay)
+
+        # Add some jitter so breakers opened together do not retry together
+        self.open_until = time.monotonic() + delay * random.uniform(0.9, 1.1)
+        self.state = OPEN
@@ -0,0 +1,153 @@
+"""Caches of Instagram profile pictures and rendered posts."""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class CacheEntry(NamedTuple):
+    """A cached file with the validators needed to revalidate it"""
+
+    data: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = 0.0
+
+
+class ProfilePictureCache:
+    """Bounded LRU cache of profile pictures keyed by username and URL
+
+    Entries are fresh for ``ttl`` seconds, after which they should be
+    revalidated with a conditional request. When a directory is given, entries
+    are also written to disk so they survive restarts.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: float = 86400,
+        directory: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self._entries: "OrderedDict[Tuple[str, str], CacheEntry]" = OrderedDict()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, username: str, url: str) -> str:
+        """Get the path of the files of an entry on disk, without extension"""
+
+        digest = hashlib.sha256(f"{username}\n{url}".encode()).hexdigest()
+        return os.path.join(self.directory or "", digest)
+
+    def _read(self, username: str, url: str) -> Optional[CacheEntry]:
+        """Read an entry from disk"""
+
+        path = self._path(username, url)
+        try:
+            with open(f"{path}.json", encoding="utf-8") as file:
+                meta = json.load(file)
+            with open(f"{path}.bin", "rb") as file:
+                data = file.read()
+        except (OSError, ValueError):
+            return None
+
+        return CacheEntry(
+            data, meta.get("etag"), meta.get("last_modified"), meta["fetched_at"]
+        )
+
+    def _write(self, username: str, url: str, entry: CacheEntry):
+        """Write an entry to disk"""
+
+        path = self._path(username, url)
+        meta = {
+            "username": username,
+            "url": url,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "fetched_at": entry.fetched_at,
+        }
+        try:
+            with open(f"{path}.bin", "wb") as file:
+                file.write(entry.data)
+            with open(f"{path}.json", "w", encoding="utf-8") as file:
+                json.dump(meta, file)
+        except OSError:
+            pass
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """Check if an entry can be used without revalidating it"""
+
+        return time.time() - entry.fetched_at < self.ttl
+
+    def get(self, username: str, url: str) -> Optional[CacheEntry]:
+        """Get an entry from memory, or from disk if it was evicted"""
+
+        key = (username, url)
+        entry = self._entries.get(key)
+        if entry is None and self.directory:
+            entry = self._read(username, url)
+            if entry is not None:
+                self._store(key, entry)
+        elif entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, username: str, url: str, entry: CacheEntry):
+        """Add or replace an entry"""
+
+        self._store((username, url), entry)
+        if self.directory:
+            self._write(username, url, entry)
+
+    def _store(self, key: Tuple[str, str], entry: CacheEntry):
+        """Store an entry in memory and evict the least recently used ones"""
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SizedCache(Generic[T]):
+    """LRU cache bounded by the total size of its values in bytes
+
+    Values larger than the whole cache are not stored at all.
+    """
+
+    def __init__(self, max_size: int, size: Callable[[T], int]):
+        self.max_size = max_size
+        self.size = size
+        self.total_size = 0
+        self._entries: "OrderedDict[str, Tuple[T, int]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[T]:
+        """Get a value, marking it as recently used"""
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: str, value: T):
+        """Add or replace a value and evict the least recently used ones"""
+
+        size = self.size(value)
+        if key in self._entries:
+            self.total_size -= self._entries.pop(key)[1]
+        if size > self.max_size:
+            return
+
+        self._entries[key] = (value, size)
+        self.total_size += size
+        while self.total_size > self.max_size:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.total_size -= evicted_size
@@ -0,0 +1,53 @@
+"""Formatting of Instagram captions for Discord embeds."""
+
+import re
+from urllib.parse import quote
+
+# Discord limits the description of an embed to 4096 characters
+MAX_DESCRIPTION_LENGTH = 4096
+ELLIPSIS = "…"
+
+# Hashtags may use any letter or digit, mentions follow Instagram usernames.
+# Each pattern starts with its symbol so the regex engine can skip ahead fast.
+HASHTAG_PATTERN = r"#(?<![\w&]#)\w+"
+MENTION_PATTERN = r"@(?<![\w.@]@)[A-Za-z0-9_](?:[A-Za-z0-9_.]*[A-Za-z0-9_])?"
+CAPTION_PATTERN = re.compile(f"({HASHTAG_PATTERN}|{MENTION_PATTERN})")
+
+
+def link(token: str) -> str:
+    """Create a markdown link to a hashtag or an account"""
+
+    name = token[1:]
+    if token.startswith("#"):
+        tag = name if name.isascii() else quote(name)
+        return f"[{token}](https://www.instagram.com/explore/tags/{tag})"
+    return f"[{token}](https://www.instagram.com/{name})"
+
+
+def format_caption(caption: str, limit: int = MAX_DESCRIPTION_LENGTH) -> str:
+    """Format a caption with clickable links for mentions and hashtags
+
+    Captions longer than the limit are cut short with an ellipsis. Links are
+    never cut in half, so a link that does not fit is left out entirely.
+    """
+
+    # Splitting leaves the text at even and the hashtags and mentions at odd
+    # positions, so the caption is only scanned once
+    parts = CAPTION_PATTERN.split(caption)
+    parts[1::2] = map(link, parts[1::2])
+
+    formatted = "".join(parts)
+    if len(formatted) <= limit:
+        return formatted
+
+    budget = limit - len(ELLIPSIS)
+    kept = []
+    for index, part in enumerate(parts):
+        if len(part) > budget:
+            if index % 2 == 0:
+                kept.append(part[:budget])
+            break
+        kept.append(part)
+        budget -= len(part)
+
+    return "".join(kept).rstrip() + ELLIPSIS
@@ -0,0 +1,22 @@
+"""Shared HTTP client session for media downloads and webhook delivery."""
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+
+def create_client_session(
+    pool_size: int = 100, pool_per_host: int = 10, keepalive_timeout: float = 30
+):
+    """Create a client session with a pool of reusable connections
+
+    The session is meant to live for the whole process so that downloads from
+    the Instagram CDN and requests to Discord reuse open TCP and TLS connections
+    instead of paying a new handshake for every post.
+    """
+
+    connector = TCPConnector(
+        limit=pool_size,
+        limit_per_host=pool_per_host,
+        keepalive_timeout=keepalive_timeout,
+        ttl_dns_cache=300,
+    )
+    return ClientSession(connector=connector, timeout=ClientTimeout(total=60))
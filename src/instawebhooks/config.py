@@ -0,0 +1,49 @@
+"""Options of a monitor, independent of the command line."""
+
+from argparse import Namespace
+from dataclasses import dataclass, fields
+from typing import Optional
+
+
+@dataclass
+class Config:  # pylint: disable=too-many-instance-attributes
+    """How a monitor checks Instagram and delivers posts to Discord
+
+    The defaults match the command line, so embedding hosts only need to set
+    the options they change.
+    """
+
+    catchup: int = 0
+    refresh_interval: int = 3600
+    adaptive: bool = False
+    min_interval: int = 300
+    max_interval: int = 21600
+    requests_per_hour: Optional[float] = None
+    stagger: bool = False
+    jitter: float = 0
+    backoff_base: float = 60
+    backoff_max: float = 3600
+    batch_delay: Optional[float] = None
+    state_file: Optional[str] = None
+    outbox: Optional[str] = None
+    pool_size: int = 100
+    pool_per_host: int = 10
+    keepalive_timeout: float = 30
+    max_downloads: int = 8
+    max_media_size: float = 10
+    avatar_cache_size: int = 256
+    avatar_cache_ttl: float = 86400
+    avatar_cache_dir: Optional[str] = None
+    embed_cache_size: int = 64
+
+    def __post_init__(self):
+        if not 0 <= self.jitter < 1:
+            raise ValueError("jitter must be at least 0 and less than 1")
+
+    @classmethod
+    def from_args(cls, args: Namespace) -> "Config":
+        """Create a config from parsed command line arguments"""
+
+        return cls(
+            **{option.name: getattr(args, option.name) for option in fields(cls)}
+        )
@@ -0,0 +1,132 @@
+"""Concurrent downloads of Instagram post media."""
+
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import ClientError, ClientResponse, ClientSession
+from instaloader.structures import Post
+
+from .cache import CacheEntry, ProfilePictureCache
+
+# Discord shows at most four images of embeds sharing a URL as a gallery
+MAX_GALLERY_IMAGES = 4
+
+# Size of the chunks media is read in
+CHUNK_SIZE = 64 * 1024
+
+
+class MediaTooLargeError(ClientError):
+    """A media file is larger than the maximum size"""
+
+
+def post_image_urls(post: Post) -> List[str]:
+    """Get the image URLs of a post, including every image of a carousel
+
+    This may fetch the full post metadata from Instagram, so it is blocking.
+    """
+
+    if post.typename == "GraphSidecar":
+        urls = [node.display_url for node in post.get_sidecar_nodes()]
+        if urls:
+            return urls[:MAX_GALLERY_IMAGES]
+    return [post.url]
+
+
+class MediaDownloader:
+    """Download media with a bound on the number of concurrent downloads"""
+
+    def __init__(
+        self,
+        session: ClientSession,
+        max_downloads: int = 8,
+        profile_pics: Optional[ProfilePictureCache] = None,
+        max_size: Optional[int] = None,
+    ):
+        self.session = session
+        self.max_size = max_size
+        self.profile_pics = profile_pics
+        self._semaphore = asyncio.Semaphore(max_downloads)
+
+    async def _read(self, res: ClientResponse) -> bytes:
+        """Read a response in chunks, giving up as soon as it is too large
+
+        The chunks are written into one buffer, sized up front when the length
+        of the response is known, which is copied once into the returned bytes.
+        """
+
+        length = res.content_length
+        if self.max_size is not None and (length or 0) > self.max_size:
+            raise MediaTooLargeError(f"{res.url} is over {self.max_size} bytes")
+
+        buffer = bytearray(length or 0)
+        size = 0
+        async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+            end = size + len(chunk)
+            if self.max_size is not None and end > self.max_size:
+                raise MediaTooLargeError(f"{res.url} is over {self.max_size} bytes")
+            buffer[size:end] = chunk
+            size = end
+
+        # Compressed responses may be longer or shorter than their length
+        del buffer[size:]
+        return bytes(buffer)
+
+    async def fetch(self, url: str) -> bytes:
+        """Download a single file"""
+
+        async with self._semaphore:
+            async with self.session.get(url) as res:
+                res.raise_for_status()
+                return await self._read(res)
+
+    async def fetch_all(self, urls: List[str]) -> List[bytes]:
+        """Download many files at once, keeping the order of the URLs
+
+        Files over the maximum size are left out.
+        """
+
+        results = await asyncio.gather(
+            *(self.fetch(url) for url in urls), return_exceptions=True
+        )
+        files = []
+        for result in results:
+            if isinstance(result, MediaTooLargeError):
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            files.append(result)
+        return files
+
+    async def fetch_profile_pic(self, username: str, url: str) -> bytes:
+        """Download a profile picture, reusing the cached one when unchanged"""
+
+        if self.profile_pics is None:
+            return await self.fetch(url)
+
+        entry = self.profile_pics.get(username, url)
+        if entry and self.profile_pics.is_fresh(entry):
+            return entry.data
+
+        # Revalidate a stale entry with a conditional request
+        headers: Dict[str, str] = {}
+        if entry and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+        async with self._semaphore:
+            async with self.session.get(url, headers=headers) as res:
+                if res.status == 304 and entry:
+                    entry = entry._replace(fetched_at=time.time())
+                else:
+                    res.raise_for_status()
+                    entry = CacheEntry(
+                        await self._read(res),
+                        res.headers.get("ETag"),
+                        res.headers.get("Last-Modified"),
+                        time.time(),
+                    )
+
+        self.profile_pics.put(username, url, entry)
+        return entry.data
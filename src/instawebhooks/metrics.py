@@ -0,0 +1,230 @@
+"""Prometheus metrics of the monitor, in the text exposition format."""
+
+import math
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, List[Tuple[str, str]], float]
+
+# Buckets in seconds, from quick webhook requests to slow Instagram checks
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+REGISTRY: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text format"""
+
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value or bucket bound for the text format"""
+
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """A metric with a value for each combination of its labels
+
+    Metrics are updated from the event loop and read from other threads, so
+    every metric has its own lock.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _check(self, labels: LabelValues):
+        """Make sure a value is given for every label"""
+
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}")
+
+    @abstractmethod
+    def samples(self) -> List[Sample]:
+        """Get the current samples of the metric"""
+
+    def render(self) -> str:
+        """Render the metric in the Prometheus text format"""
+
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for name, pairs, value in self.samples():
+            labels = ",".join(f'{key}="{_escape(item)}"' for key, item in pairs)
+            lines.append(
+                f"{name}{{{labels}}} {_format_value(value)}"
+                if labels
+                else f"{name} {_format_value(value)}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """A value that only goes up, such as the number of requests"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        """Add to the counter of the given labels"""
+
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            (self.name, list(zip(self.labels, labels)), value)
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    """A value that goes up and down, such as the length of a queue"""
+
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float):
+        """Set the gauge of the given labels"""
+
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Counts of observed values, such as latencies, in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, *labels: str, value: float):
+        """Record a value for the given labels"""
+
+        self._check(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(labels, [0] * len(self.buckets))
+            counts[index] += 1
+            self._sums[labels] = self._sums.get(labels, 0) + value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = [
+                (labels, list(counts), self._sums[labels])
+                for labels, counts in self._counts.items()
+            ]
+
+        samples: List[Sample] = []
+        for labels, counts, total in values:
+            pairs = list(zip(self.labels, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        pairs + [("le", _format_value(bound))],
+                        cumulative,
+                    )
+                )
+            samples.append((f"{self.name}_sum", pairs, total))
+            samples.append((f"{self.name}_count", pairs, cumulative))
+        return samples
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text format"""
+
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+POLL_SECONDS = Histogram(
+    "instawebhooks_poll_seconds",
+    "Time to check an account for new posts and queue them",
+    ["account"],
+)
+INSTAGRAM_REQUESTS = Counter(
+    "instawebhooks_instagram_requests_total",
+    "Timeline fetches from Instagram",
+    ["account"],
+)
+INSTAGRAM_ERRORS = Counter(
+    "instawebhooks_instagram_errors_total",
+    "Failed timeline fetches from Instagram, by whether Instagram throttled them",
+    ["account", "reason"],
+)
+POSTS_DETECTED = Counter(
+    "instawebhooks_posts_detected_total",
+    "New posts found",
+    ["account"],
+)
+POST_BUILD_ERRORS = Counter(
+    "instawebhooks_post_build_errors_total",
+    "Failed attempts to create the messages of a new post",
+    ["account"],
+)
+MEDIA_BYTES = Counter(
+    "instawebhooks_media_download_bytes_total",
+    "Bytes of post images downloaded",
+    ["account"],
+)
+MEDIA_SECONDS = Histogram(
+    "instawebhooks_media_download_seconds",
+    "Time to download the images and profile picture of a post",
+    ["account"],
+)
+WEBHOOK_SECONDS = Histogram(
+    "instawebhooks_webhook_request_seconds",
+    "Time of a single request to a Discord webhook",
+    ["webhook"],
+)
+WEBHOOK_RATE_LIMITED = Counter(
+    "instawebhooks_webhook_rate_limited_total",
+    "Webhook requests rejected by Discord with status 429",
+    ["webhook"],
+)
+WEBHOOK_ERRORS = Counter(
+    "instawebhooks_webhook_errors_total",
+    "Failed attempts to deliver a message to a webhook",
+    ["webhook"],
+)
+QUEUE_DEPTH = Gauge(
+    "instawebhooks_outbox_messages",
+    "Messages waiting in the outbox to be delivered",
+    ["webhook"],
+)
+DELIVERY_DELAY = Histogram(
+    "instawebhooks_delivery_delay_seconds",
+    "Time from finding a post to delivering it to a webhook",
+    ["webhook"],
+)
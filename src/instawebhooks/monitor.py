@@ -0,0 +1,812 @@
+"""Monitoring of Instagram accounts for new posts to send to Discord."""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from aiohttp import ClientError
+from instaloader.exceptions import (
+    AbortDownloadException,
+    ConnectionException,
+    InstaloaderException,
+    LoginRequiredException,
+    QueryReturnedForbiddenException,
+    TooManyRequestsException,
+)
+from instaloader.instaloader import Instaloader
+from instaloader.instaloadercontext import RateController
+from instaloader.structures import Post, Profile
+
+from .batching import MAX_UPLOAD_SIZE, WebhookBatcher
+from .breaker import CircuitBreaker
+from .cache import ProfilePictureCache, SizedCache
+from .caption import format_caption
+from .client import create_client_session
+from .config import Config
+from .media import MediaDownloader, post_image_urls
+from .metrics import (
+    INSTAGRAM_ERRORS,
+    INSTAGRAM_REQUESTS,
+    MEDIA_BYTES,
+    MEDIA_SECONDS,
+    POLL_SECONDS,
+    POST_BUILD_ERRORS,
+    POSTS_DETECTED,
+)
+from .outbox import Outbox, OutboxDelivery, OutboxEntry
+from .ratelimit import RateLimiter
+from .scheduler import AdaptiveInterval, Interval, Scheduler
+from .state import Cursor, CursorStore
+from .subscriptions import Subscription
+from .template import compile_template
+from .webhook import Attachment, Message
+
+logger = logging.getLogger(__name__)
+
+# Pinned posts are shown first on a profile even though they are older
+MAX_PINNED_POSTS = 3
+
+# Errors that mean Instagram is limiting every request from this address
+THROTTLING_ERRORS = (
+    TooManyRequestsException,
+    LoginRequiredException,
+    QueryReturnedForbiddenException,
+    AbortDownloadException,
+)
+
+
+def is_throttling(error: BaseException) -> bool:
+    """Check if an Instaloader error means Instagram is throttling this address
+
+    A 429 that Instaloader gave up on is raised as a connection error caused
+    by the 429.
+    """
+
+    return isinstance(error, THROTTLING_ERRORS) or (
+        isinstance(error, ConnectionException)
+        and isinstance(error.__cause__, TooManyRequestsException)
+    )
+
+
+class NoWaitRateController(RateController):
+    """Rate controller that leaves a 429 to the circuit breakers
+
+    Instaloader sleeps for up to hours after a 429, holding the thread shared by
+    every account. Failing right away lets the breakers back off instead.
+    """
+
+    def handle_429(self, query_type: str):
+        pass
+
+
+def create_loader() -> Instaloader:
+    """Create an Instaloader instance suited to monitoring many accounts"""
+
+    return Instaloader(max_connection_attempts=1, rate_controller=NoWaitRateController)
+
+
+# Errors that keep the messages of a post from being created for now
+BUILD_ERRORS = (ClientError, asyncio.TimeoutError, InstaloaderException)
+
+# Checks that may fail to create a post before it is sent without its media
+MAX_BUILD_ATTEMPTS = 3
+
+FOOTER_ICON_URL = (
+    "https://www.instagram.com/static/images/ico/favicon-192.png/68d99ba29cc8.png"
+)
+
+# Callbacks for the events of a monitor
+PostDetected = Callable[[Post, List[Subscription]], None]
+PostDelivered = Callable[[OutboxEntry], None]
+PostsDelivered = Callable[[List[OutboxEntry]], None]
+PollFinished = Callable[[str, int], None]
+ErrorHandler = Callable[[str, BaseException], None]
+
+# Rendered embeds and media of a post
+RenderedPost = Tuple[List[Dict], List[Attachment]]
+
+
+class Timeline(NamedTuple):
+    """Posts read from the timeline of an account"""
+
+    new_posts: List[Post]
+    latest_posts: List[Post]
+    newest: Optional[Cursor]
+    post_times: List[float]
+
+
+def login(
+    loader: Instaloader,
+    username: str,
+    password: Optional[str] = None,
+    session_file: Optional[str] = None,
+):
+    """Log into Instagram, reusing the saved session while it is still valid
+
+    Without a password, it is asked for on the terminal.
+    """
+
+    try:
+        loader.load_session_from_file(username, session_file)
+        logger.info("Loaded Instagram session of '%s'.", username)
+    except FileNotFoundError:
+        pass
+
+    # Only log in again when there is no saved session or it has expired
+    if not loader.context.is_logged_in or loader.test_login() != username:
+        logger.info("Logging into Instagram...")
+        if password is None:
+            loader.interactive_login(username)
+        else:
+            loader.login(username, password)
+        loader.save_session_to_file(session_file)
+
+
+def format_message(post: Post, message_content: str):
+    """Format the message content with placeholders"""
+
+    logger.debug("Formatting message for placeholders...")
+
+    # Templates are compiled once and then rendered in a single pass
+    return compile_template(message_content)(post)
+
+
+def fit_in_upload(images: List[bytes], upload_size: int = 0) -> List[bytes]:
+    """Leave out the images that do not fit in a single Discord upload"""
+
+    for index, image in enumerate(images):
+        upload_size += len(image)
+        if upload_size > MAX_UPLOAD_SIZE:
+            return images[:index]
+    return images
+
+
+def post_cursor(post: Post):
+    """Create a cursor pointing at a post"""
+
+    return Cursor(post.shortcode, post.date_utc.timestamp())
+
+
+def posts_to_send(timeline: Timeline, cursor: Optional[Cursor]):
+    """Get the posts of a timeline a subscription has not seen yet, oldest first"""
+
+    posts = {post.shortcode: post for post in timeline.latest_posts}
+    if cursor:
+        posts.update(
+            (post.shortcode, post)
+            for post in timeline.new_posts
+            if post.date_utc.timestamp() > cursor.timestamp
+        )
+    return sorted(posts.values(), key=lambda p: p.date_utc)
+
+
+class Monitor:  # pylint: disable=too-many-instance-attributes
+    """Check Instagram accounts for new posts and send them to Discord webhooks
+
+    Nothing happens until the monitor is run. Its events are reported to the
+    ``on_*`` callbacks, which are called from the thread running the monitor
+    and should return quickly.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        subscriptions: List[Subscription],
+        loader: Optional[Instaloader] = None,
+    ):
+        self.config = config
+        self.subscriptions = subscriptions
+
+        # Share one Instaloader context, and its login session, between all checks
+        self.loader = loader or create_loader()
+
+        # Instaloader is blocking and not thread-safe, so run it on a single thread
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="instaloader"
+        )
+
+        # Load the last seen post of each subscription
+        self.cursors = CursorStore(config.state_file)
+
+        # Keep new posts until they are delivered, even across restarts
+        self.outbox = Outbox(config.outbox)
+
+        # Check accounts at a fixed interval, or adapt it to their posting pattern
+        self.poll_interval: Interval = config.refresh_interval
+        if config.adaptive:
+            # By default, spend as many requests as checking every account at the
+            # interval
+            self.poll_interval = AdaptiveInterval(
+                config.requests_per_hour
+                or len({entry.instagram_username for entry in subscriptions})
+                * 3600
+                / config.refresh_interval,
+                config.min_interval,
+                config.max_interval,
+            )
+
+        # Share the webhook rate limits between all subscriptions
+        self.rate_limiter = RateLimiter()
+
+        # Back off from Instagram as a whole and from each account after errors
+        self.instagram_breaker = CircuitBreaker(config.backoff_base, config.backoff_max)
+        self.account_breakers: Dict[str, CircuitBreaker] = {}
+
+        # Profiles are kept between checks so their metadata is only fetched once
+        self.profiles: Dict[str, Profile] = {}
+
+        # Rendered embeds and media of recent posts, so no post is rendered twice
+        self.rendered_posts: SizedCache[RenderedPost] = SizedCache(
+            config.embed_cache_size * 1024 * 1024,
+            lambda rendered: sum(len(data) for _, data in rendered[1]),
+        )
+
+        # Failed attempts to create the posts that are still to be sent
+        self.build_failures: Dict[str, int] = {}
+
+        self.on_post_detected: Optional[PostDetected] = None
+        self.on_post_delivered: Optional[PostDelivered] = None
+        self.on_posts_delivered: Optional[PostsDelivered] = None
+        self.on_poll_finished: Optional[PollFinished] = None
+        self.on_error: Optional[ErrorHandler] = None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional["asyncio.Task[Any]"] = None
+        self._stop_requested = threading.Event()
+
+    def _emit(self, callback: Optional[Callable[..., None]], *event: Any):
+        """Call an event callback, never letting it stop the monitor"""
+
+        if callback is None:
+            return
+        try:
+            callback(*event)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Error in event callback.")
+
+    async def create_embed(self, downloader: MediaDownloader, post: Post):
+        """Create Discord embed objects from an Instagram post"""
+
+        logger.debug("Creating post embed...")
+
+        # discord.py is slow to import and only needed for posts with embeds
+        from discord import Embed  # pylint: disable=import-outside-toplevel
+
+        post_url = f"https://www.instagram.com/p/{post.shortcode}/"
+
+        # Resolving carousel images may query Instagram, so keep it off the event
+        # loop
+        image_urls = await asyncio.get_running_loop().run_in_executor(
+            self.executor, post_image_urls, post
+        )
+
+        # Download the post images and profile picture at the same time
+        started = time.perf_counter()
+        post_images, profile_pic_bytes = await asyncio.gather(
+            downloader.fetch_all(image_urls),
+            downloader.fetch_profile_pic(
+                post.owner_username, post.owner_profile.profile_pic_url
+            ),
+        )
+
+        MEDIA_SECONDS.observe(post.owner_username, value=time.perf_counter() - started)
+        MEDIA_BYTES.inc(
+            post.owner_username, amount=sum(len(image) for image in post_images)
+        )
+
+        post_images = fit_in_upload(post_images, len(profile_pic_bytes))
+
+        image_filenames = ["post_image.webp"] + [
+            f"post_image_{index}.webp" for index in range(1, len(post_images))
+        ]
+
+        # Format the post caption with clickable links for mentions and hashtags
+        post_caption = format_caption(post.caption or "")
+
+        embed = Embed(
+            color=13500529,
+            title=post.owner_profile.full_name,
+            description=post_caption,
+            url=post_url,
+            timestamp=post.date,
+        )
+        embed.set_author(
+            name=post.owner_username,
+            url=f"https://www.instagram.com/{post.owner_username}/",
+            icon_url="attachment://profile_pic.webp",
+        )
+        embed.set_footer(text="Instagram", icon_url=FOOTER_ICON_URL)
+        if post_images:
+            embed.set_image(url="attachment://post_image.webp")
+
+        # Embeds sharing the post URL are shown by Discord as one image gallery
+        embeds = [embed] + [
+            Embed(url=post_url).set_image(url=f"attachment://{filename}")
+            for filename in image_filenames[1:]
+        ]
+
+        attachments = list(zip(image_filenames, post_images))
+        attachments.append(("profile_pic.webp", profile_pic_bytes))
+
+        return embeds, attachments
+
+    async def create_messages(
+        self, downloader: MediaDownloader, post: Post, receivers: List[Subscription]
+    ):
+        """Create the webhook messages of a new Instagram post for its subscriptions
+
+        The embed and its images are only created once, cached by shortcode and
+        shared by every subscription that wants an embed.
+        """
+
+        embeds: List[Dict] = []
+        attachments: List[Attachment] = []
+        if not all(subscription.no_embed for subscription in receivers):
+            rendered = self.rendered_posts.get(post.shortcode)
+            if rendered is None:
+                post_embeds, post_attachments = await self.create_embed(
+                    downloader, post
+                )
+                rendered = (
+                    [embed.to_dict() for embed in post_embeds],
+                    post_attachments,
+                )
+                self.rendered_posts.put(post.shortcode, rendered)
+            embeds, attachments = rendered
+
+        messages = []
+        for subscription in receivers:
+            message_content = subscription.message_content
+            if message_content:
+                message_content = format_message(post, message_content)
+
+            if subscription.no_embed:
+                messages.append(Message(message_content))
+            else:
+                messages.append(Message(message_content, embeds, attachments))
+        return messages
+
+    def send_to_discord(
+        self,
+        delivery: OutboxDelivery,
+        subscription: Subscription,
+        post: Post,
+        message: Message,
+    ):
+        """Queue a new Instagram post to be sent to Discord using a webhook"""
+
+        logger.debug("Sending post sent to Discord...")
+
+        delivery.put(subscription.discord_webhook_url, message, post.shortcode)
+
+    def _sent(self, queued: OutboxEntry):
+        """Report a post that was delivered to Discord"""
+
+        logger.info("New post sent to Discord successfully.")
+        logger.debug(
+            "Delivered post %s after %d retries.", queued.label, queued.attempts
+        )
+        self._emit(self.on_post_delivered, queued)
+
+    def _round_sent(self, queued: List[OutboxEntry]):
+        """Report every post delivered to a webhook in one delivery round"""
+
+        self._emit(self.on_posts_delivered, queued)
+
+    def _failed(self, queued: OutboxEntry, error: BaseException, retry: bool):
+        """Report a post that could not be delivered to Discord"""
+
+        if retry:
+            logger.warning(
+                "Failed to send post %s to Discord, retrying: %s", queued.label, error
+            )
+        else:
+            logger.error("Failed to send post %s to Discord: %s", queued.label, error)
+        self._emit(self.on_error, queued.url, error)
+
+    def get_profile(self, username: str):
+        """Get the profile of an Instagram account, reusing it between checks"""
+
+        profile = self.profiles.get(username)
+        if profile is None:
+            profile = self.profiles[username] = Profile.from_username(
+                self.loader.context, username
+            )
+        elif not self.loader.context.is_logged_in:
+            # Anonymous timelines start from the profile metadata, so refresh it
+            profile._has_full_metadata = False  # pylint: disable=protected-access
+        return profile
+
+    def oldest_cursor(
+        self, account_subscriptions: List[Subscription]
+    ) -> Optional[Cursor]:
+        """Get the oldest cursor of the subscriptions that were checked before"""
+
+        seen = [
+            self.cursors.get(subscription.key) for subscription in account_subscriptions
+        ]
+        return min(
+            (cursor for cursor in seen if cursor),
+            key=lambda cursor: cursor.timestamp,
+            default=None,
+        )
+
+    def assign_posts(
+        self, timeline: Timeline, account_subscriptions: List[Subscription]
+    ) -> List[Tuple[Post, List[Subscription]]]:
+        """Pair the new posts, oldest first, with the subscriptions to send them to"""
+
+        posts: Dict[str, Post] = {}
+        receivers: Dict[str, List[Subscription]] = {}
+        for subscription in account_subscriptions:
+            for post in posts_to_send(timeline, self.cursors.get(subscription.key)):
+                posts[post.shortcode] = post
+                receivers.setdefault(post.shortcode, []).append(subscription)
+
+        return [
+            (post, receivers[post.shortcode])
+            for post in sorted(posts.values(), key=lambda p: p.date_utc)
+        ]
+
+    def fetch_new_posts(
+        self, username: str, cursor: Optional[Cursor], catchup: int = 0
+    ) -> Timeline:
+        """Fetch the posts made after the cursor and the latest posts from Instagram
+
+        Reading stops at the first post that was already seen, so a normal check
+        only needs the first page of the timeline. The cursor of the newest post
+        and the timestamps of the posts made after the cursor are returned with
+        the posts. Without a cursor, only the newest post is timed, as older ones
+        may be pinned.
+        """
+
+        latest_posts: List[Post] = []
+        new_posts: List[Post] = []
+        newest = cursor
+
+        for index, post in enumerate(self.get_profile(username).get_posts()):
+            if newest is None or post.date_utc.timestamp() > newest.timestamp:
+                newest = post_cursor(post)
+            if index < catchup:
+                latest_posts.append(post)
+
+            if cursor and post.shortcode != cursor.shortcode:
+                if post.date_utc.timestamp() > cursor.timestamp:
+                    new_posts.append(post)
+                    continue
+
+            # Keep reading past possibly pinned posts and the posts to catch up on
+            if index >= MAX_PINNED_POSTS and index >= catchup - 1:
+                break
+
+        if catchup > 0:
+            logger.info("Sending last %s posts on startup...", catchup)
+
+        post_times = [post.date_utc.timestamp() for post in new_posts]
+        if cursor is None and newest:
+            post_times.append(newest.timestamp)
+
+        return Timeline(new_posts, latest_posts, newest, post_times)
+
+    def _fetch_failed(
+        self, username: str, account_breaker: CircuitBreaker, error: BaseException
+    ):
+        """Back off from Instagram or the account after a failed fetch"""
+
+        if is_throttling(error):
+            INSTAGRAM_ERRORS.inc(username, "throttled")
+            self.instagram_breaker.record_failure()
+            logger.warning(
+                "instaloader: error: %s. Backing off from Instagram for %d seconds.",
+                error,
+                self.instagram_breaker.retry_after(),
+            )
+            if isinstance(error, LoginRequiredException):
+                logger.warning(
+                    "Login to Instagram with the --login flag to avoid this."
+                )
+        else:
+            INSTAGRAM_ERRORS.inc(username, "account")
+            account_breaker.record_failure()
+            logger.warning(
+                "instaloader: error: %s. Backing off from '%s' for %d seconds.",
+                error,
+                username,
+                account_breaker.retry_after(),
+            )
+        self._emit(self.on_error, username, error)
+
+    async def fetch_with_backoff(
+        self, username: str, cursor: Optional[Cursor], catchup: int = 0
+    ) -> Optional[Timeline]:
+        """Fetch new posts unless backing off from Instagram or the account"""
+
+        account_breaker = self.account_breakers.setdefault(
+            username, CircuitBreaker(self.config.backoff_base, self.config.backoff_max)
+        )
+
+        # Skip the check entirely while backing off, so it costs no requests
+        breakers = (self.instagram_breaker, account_breaker)
+        if not all(breaker.ready() for breaker in breakers):
+            logger.info(
+                "Skipping check of '%s', backing off for %d more seconds.",
+                username,
+                max(breaker.retry_after() for breaker in breakers),
+            )
+            return None
+        for breaker in breakers:
+            breaker.allow()
+
+        logger.info("Checking for new posts from '%s'", username)
+
+        # Instaloader is blocking, so fetch the posts without stalling the event loop
+        INSTAGRAM_REQUESTS.inc(username)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.fetch_new_posts, username, cursor, catchup
+            )
+        except InstaloaderException as fetch_exc:
+            self._fetch_failed(username, account_breaker, fetch_exc)
+            return None
+
+        self.instagram_breaker.record_success()
+        account_breaker.record_success()
+        return result
+
+    def _build_failed(self, username: str, post: Post, error: BaseException) -> bool:
+        """Count a failed attempt to create a post
+
+        Returns True once the post failed often enough to be sent without its
+        media instead.
+        """
+
+        POST_BUILD_ERRORS.inc(username)
+        self._emit(self.on_error, username, error)
+
+        attempts = self.build_failures.get(post.shortcode, 0) + 1
+        self.build_failures[post.shortcode] = attempts
+        if attempts < MAX_BUILD_ATTEMPTS:
+            logger.error(
+                "Failed to create post %s, retrying on the next check: %r",
+                post.shortcode,
+                error,
+            )
+            return False
+
+        logger.error(
+            "Failed to create post %s %d times, sending it without media: %r",
+            post.shortcode,
+            attempts,
+            error,
+        )
+        return True
+
+    def text_messages(self, post: Post, receivers: List[Subscription]):
+        """Create messages of a post with only text, for when its media fails"""
+
+        post_url = f"https://www.instagram.com/p/{post.shortcode}/"
+        messages = []
+        for subscription in receivers:
+            content = post_url
+            if subscription.message_content:
+                try:
+                    content = format_message(post, subscription.message_content)
+                except InstaloaderException:
+                    pass
+            messages.append(Message(content))
+        return messages
+
+    async def queue_posts(
+        self,
+        delivery: OutboxDelivery,
+        downloader: MediaDownloader,
+        username: str,
+        new_posts: List[Tuple[Post, List[Subscription]]],
+    ) -> bool:
+        """Queue new posts of an account for delivery to their subscriptions
+
+        The messages of all posts are built at once, but queued in order. Posts
+        are safe in the outbox once queued, so the cursors can move on. When a
+        post cannot be built, queueing stops there so it is retried in order on
+        the next check, and False is returned. A post that keeps failing is sent
+        without its media, so it never holds up the account.
+        """
+
+        messages = [
+            asyncio.ensure_future(self.create_messages(downloader, post, receivers))
+            for post, receivers in new_posts
+        ]
+
+        try:
+            for (post, receivers), message in zip(new_posts, messages):
+                try:
+                    post_messages = await message
+                except BUILD_ERRORS as build_exc:
+                    if not self._build_failed(username, post, build_exc):
+                        return False
+                    post_messages = self.text_messages(post, receivers)
+                self.build_failures.pop(post.shortcode, None)
+
+                # Only report a post once, when it is queued
+                logger.info(
+                    "New post found: https://www.instagram.com/p/%s", post.shortcode
+                )
+                POSTS_DETECTED.inc(username)
+                self._emit(self.on_post_detected, post, receivers)
+                for subscription, post_message in zip(receivers, post_messages):
+                    self.send_to_discord(delivery, subscription, post, post_message)
+                    self.cursors.advance(subscription.key, post_cursor(post))
+        finally:
+            for message in messages:
+                message.cancel()
+        return True
+
+    async def check_for_new_posts(  # pylint: disable=too-many-arguments
+        self,
+        delivery: OutboxDelivery,
+        downloader: MediaDownloader,
+        username: str,
+        account_subscriptions: List[Subscription],
+        catchup: int = 0,
+    ):
+        """Check an Instagram account for new posts and send them to its webhooks
+
+        The account is fetched once for all its subscriptions, reading back to
+        the oldest cursor, and each subscription gets the posts it has not seen.
+        """
+
+        started = time.perf_counter()
+
+        # Read back far enough for the subscription that is furthest behind
+        timeline = await self.fetch_with_backoff(
+            username, self.oldest_cursor(account_subscriptions), catchup
+        )
+        if timeline is None:
+            return
+
+        if isinstance(self.poll_interval, AdaptiveInterval):
+            self.poll_interval.record(username, timeline.post_times)
+
+        new_posts = self.assign_posts(timeline, account_subscriptions)
+        if not new_posts:
+            logger.info("No new posts found.")
+        queued = await self.queue_posts(delivery, downloader, username, new_posts)
+
+        # Never move past a post that still has to be sent
+        if queued and timeline.newest:
+            for subscription in account_subscriptions:
+                self.cursors.advance(subscription.key, timeline.newest)
+
+        POLL_SECONDS.observe(username, value=time.perf_counter() - started)
+        self._emit(self.on_poll_finished, username, len(new_posts))
+
+    def poll_account(
+        self,
+        delivery: OutboxDelivery,
+        downloader: MediaDownloader,
+        username: str,
+        account_subscriptions: List[Subscription],
+    ):
+        """Create a scheduler job that checks an account for all its subscriptions"""
+
+        catchup = self.config.catchup
+
+        async def job():
+            nonlocal catchup
+            await self.check_for_new_posts(
+                delivery, downloader, username, account_subscriptions, catchup
+            )
+            catchup = 0
+
+        return job
+
+    async def run(self):
+        """Check every subscription for new posts from a shared scheduler"""
+
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        config = self.config
+
+        # The monitor may have been stopped before it started running
+        if self._stop_requested.is_set():
+            logger.info("Monitoring stopped.")
+            return
+
+        async with create_client_session(
+            config.pool_size, config.pool_per_host, config.keepalive_timeout
+        ) as session:
+            downloader = MediaDownloader(
+                session,
+                config.max_downloads,
+                ProfilePictureCache(
+                    config.avatar_cache_size,
+                    config.avatar_cache_ttl,
+                    config.avatar_cache_dir,
+                ),
+                int(config.max_media_size * 1024 * 1024),
+            )
+            batcher = WebhookBatcher(session, self.rate_limiter, config.batch_delay)
+            delivery = OutboxDelivery(
+                self.outbox,
+                batcher,
+                on_sent=self._sent,
+                on_round_sent=self._round_sent,
+                on_failed=self._failed,
+            )
+            delivery.start()
+            scheduler = Scheduler(
+                self.poll_interval,
+                config.jitter,
+                on_error=lambda username, error: self._emit(
+                    self.on_error, username, error
+                ),
+            )
+
+            # Fetch every account once, however many webhooks it is sent to
+            accounts: Dict[str, List[Subscription]] = {}
+            for subscription in self.subscriptions:
+                accounts.setdefault(subscription.instagram_username, []).append(
+                    subscription
+                )
+
+            jobs = []
+            for username, account_subscriptions in accounts.items():
+                if isinstance(self.poll_interval, AdaptiveInterval):
+                    self.poll_interval.add(username)
+                jobs.append(
+                    (
+                        username,
+                        self.poll_account(
+                            delivery, downloader, username, account_subscriptions
+                        ),
+                    )
+                )
+
+            if config.stagger:
+                scheduler.stagger(jobs)
+            else:
+                for name, job in jobs:
+                    scheduler.add(name, job)
+
+            try:
+                await scheduler.run()
+            finally:
+                delivery.close()
+                batcher.close()
+
+    def run_forever(self):
+        """Run the monitor in its own event loop until it is stopped
+
+        This blocks the calling thread, so it is usually called from a thread
+        of its own.
+        """
+
+        try:
+            asyncio.run(self.run())
+        except asyncio.CancelledError:
+            logger.info("Monitoring stopped.")
+        finally:
+            self.close()
+
+    def stop(self):
+        """Stop the monitor, from any thread
+
+        A monitor stopped before it runs returns as soon as it is run.
+        """
+
+        self._stop_requested.set()
+        if self._loop and self._task:
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:
+                # The loop was closed, so the monitor already stopped
+                pass
+
+    def close(self):
+        """Release the Instaloader thread and the outbox"""
+
+        self.executor.shutdown(wait=False)
+        self.outbox.close()
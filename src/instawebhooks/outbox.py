@@ -0,0 +1,323 @@
+"""Durable queue of webhook messages waiting to be delivered to Discord."""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Callable, DefaultDict, Dict, List, NamedTuple, Optional, Tuple
+
+from .batching import WebhookBatcher
+from .breaker import CircuitBreaker
+from .cache import SizedCache
+from .metrics import DELIVERY_DELAY, QUEUE_DEPTH, WEBHOOK_ERRORS
+from .ratelimit import webhook_id
+from .webhook import Message, WebhookError
+
+# Number of queued messages, and bytes of their media, a worker hands to the
+# batcher at once
+PENDING_BATCH_SIZE = 50
+PENDING_BATCH_BYTES = 16 * 1024 * 1024
+
+# Bytes of queued media to keep in memory, so retries and fan-out skip the disk
+BLOB_CACHE_SIZE = 32 * 1024 * 1024
+
+
+class OutboxEntry(NamedTuple):
+    """A queued webhook message"""
+
+    id: int
+    url: str
+    label: str
+    message: Message
+    attempts: int
+    created: float
+
+
+class Outbox:
+    """Webhook messages waiting to be sent, stored in a SQLite database
+
+    Messages are kept until they are delivered, so a failing webhook or a
+    restart never loses a post. Without a path the queue is kept in memory.
+    Attachments are stored by their hash, so the media of a post sent to many
+    webhooks is only stored once.
+    """
+
+    def __init__(self, path: Optional[str] = None, cache_size: int = BLOB_CACHE_SIZE):
+        # The queue is used by one thread at a time, not always the one opening it
+        self.connection = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._blobs: SizedCache[bytes] = SizedCache(cache_size, len)
+        with self.connection:
+            self.connection.executescript("""
+                PRAGMA foreign_keys = ON;
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    embeds TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    message_id INTEGER NOT NULL
+                        REFERENCES messages (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (message_id, position)
+                );
+                CREATE TABLE IF NOT EXISTS blobs (
+                    digest TEXT PRIMARY KEY,
+                    data BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS messages_url ON messages (url, id);
+                CREATE INDEX IF NOT EXISTS files_digest ON files (digest);
+                """)
+
+    def put(self, url: str, message: Message, label: str = "") -> int:
+        """Queue a message for a webhook, returning its ID"""
+
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO messages (url, label, content, embeds, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, label, message.content, json.dumps(message.embeds), time.time()),
+            )
+            message_id = int(cursor.lastrowid or 0)
+
+            files = []
+            for position, (filename, data) in enumerate(message.attachments):
+                digest = hashlib.sha256(data).hexdigest()
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)",
+                    (digest, data),
+                )
+                self._blobs.put(digest, data)
+                files.append((message_id, position, filename, digest))
+
+            self.connection.executemany(
+                "INSERT INTO files (message_id, position, filename, digest) "
+                "VALUES (?, ?, ?, ?)",
+                files,
+            )
+        return message_id
+
+    def _blob(self, digest: str) -> bytes:
+        """Read stored media, from memory if it was used recently"""
+
+        data = self._blobs.get(digest)
+        if data is None:
+            (data,) = self.connection.execute(
+                "SELECT data FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+            self._blobs.put(digest, data)
+        return data
+
+    def counts(self) -> Dict[str, int]:
+        """Count the queued messages of each webhook"""
+
+        rows = self.connection.execute(
+            "SELECT url, COUNT(*) FROM messages GROUP BY url"
+        )
+        return dict(rows.fetchall())
+
+    def pending(
+        self,
+        url: str,
+        limit: int = PENDING_BATCH_SIZE,
+        max_bytes: int = PENDING_BATCH_BYTES,
+    ) -> List[OutboxEntry]:
+        """Get the oldest queued messages of a webhook
+
+        Media is only loaded for the messages that fit in the byte limit, but
+        the first message is always returned, however large it is.
+        """
+
+        rows = self.connection.execute(
+            "SELECT id, label, content, embeds, attempts, created, ("
+            "    SELECT COALESCE(SUM(LENGTH(blobs.data)), 0) FROM files"
+            "    JOIN blobs ON blobs.digest = files.digest"
+            "    WHERE files.message_id = messages.id"
+            ") FROM messages WHERE url = ? ORDER BY id LIMIT ?",
+            (url, limit),
+        ).fetchall()
+
+        entries: List[OutboxEntry] = []
+        total = 0
+        for *row, size in rows:
+            total += size
+            if entries and total > max_bytes:
+                break
+            entries.append(self._entry(url, tuple(row)))
+        return entries
+
+    def _entry(self, url: str, row: Tuple[int, str, str, str, int, float]):
+        """Load a queued message with its media"""
+
+        message_id, label, content, embeds, attempts, created = row
+        files = self.connection.execute(
+            "SELECT filename, digest FROM files WHERE message_id = ? ORDER BY position",
+            (message_id,),
+        ).fetchall()
+        attachments = [(filename, self._blob(digest)) for filename, digest in files]
+        message = Message(content, json.loads(embeds), attachments)
+        return OutboxEntry(message_id, url, label, message, attempts, created)
+
+    def remove(self, message_ids: List[int]):
+        """Remove delivered or rejected messages from the queue"""
+
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM messages WHERE id = ?", [(id_,) for id_ in message_ids]
+            )
+            self.connection.execute(
+                "DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM files)"
+            )
+
+    def record_failure(self, message_ids: List[int]):
+        """Count a failed delivery attempt of messages"""
+
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE messages SET attempts = attempts + 1 WHERE id = ?",
+                [(id_,) for id_ in message_ids],
+            )
+
+    def close(self):
+        """Close the database"""
+
+        self.connection.close()
+
+
+def is_permanent(error: BaseException) -> bool:
+    """Check if Discord rejected a message for good, so retrying is pointless"""
+
+    return (
+        isinstance(error, WebhookError)
+        and 400 <= error.status < 500
+        and error.status != 429
+    )
+
+
+class OutboxDelivery:
+    """Workers that drain an outbox, retrying failed webhooks with a backoff
+
+    Every webhook has its own worker, so a slow or failing webhook never
+    holds up polling or the other webhooks. Messages of a webhook are always
+    delivered in the order they were queued.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        outbox: Outbox,
+        batcher: WebhookBatcher,
+        *,
+        on_sent: Optional[Callable[[OutboxEntry], None]] = None,
+        on_round_sent: Optional[Callable[[List[OutboxEntry]], None]] = None,
+        on_failed: Optional[Callable[[OutboxEntry, BaseException, bool], None]] = None,
+        base_delay: float = 5,
+        max_delay: float = 900,
+    ):
+        self.outbox = outbox
+        self.batcher = batcher
+        self.on_sent = on_sent
+        self.on_round_sent = on_round_sent
+        self.on_failed = on_failed
+        self._breakers: DefaultDict[str, CircuitBreaker] = defaultdict(
+            lambda: CircuitBreaker(base_delay, max_delay)
+        )
+        self._workers: Dict[str, "asyncio.Task[None]"] = {}
+
+    def put(self, url: str, message: Message, label: str = "") -> int:
+        """Queue a message and make sure its webhook is being drained"""
+
+        message_id = self.outbox.put(url, message, label)
+        QUEUE_DEPTH.inc(webhook_id(url))
+        self.notify(url)
+        return message_id
+
+    def notify(self, url: str):
+        """Start a worker for a webhook, unless it already has one"""
+
+        if url not in self._workers:
+            self._workers[url] = asyncio.ensure_future(self._work(url))
+
+    def start(self):
+        """Start draining the messages left over from a previous run"""
+
+        for url, count in self.outbox.counts().items():
+            QUEUE_DEPTH.set(webhook_id(url), value=count)
+            self.notify(url)
+
+    def close(self):
+        """Stop the workers, keeping undelivered messages queued"""
+
+        for worker in list(self._workers.values()):
+            worker.cancel()
+
+    async def _work(self, url: str):
+        """Deliver the queued messages of a webhook until none are left"""
+
+        breaker = self._breakers[url]
+        try:
+            # Wait for more messages first, so the batcher can merge them
+            if self.batcher.batch_delay:
+                await asyncio.sleep(self.batcher.batch_delay)
+
+            while True:
+                await asyncio.sleep(breaker.retry_after())
+
+                entries = self.outbox.pending(url)
+                if not entries:
+                    return
+
+                futures = [self.batcher.submit(url, entry.message) for entry in entries]
+                await asyncio.wait(futures)
+
+                if self._settle(entries, futures):
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+        finally:
+            del self._workers[url]
+
+    def _settle(
+        self, entries: List[OutboxEntry], futures: List["asyncio.Future[None]"]
+    ) -> bool:
+        """Remove finished messages from the outbox, returning False on errors"""
+
+        done: List[int] = []
+        failed: List[int] = []
+        sent: List[OutboxEntry] = []
+
+        for entry, future in zip(entries, futures):
+            # Messages queued behind a failed one were not sent and stay queued
+            if future.cancelled():
+                continue
+
+            key = webhook_id(entry.url)
+            error = future.exception()
+            if error is None:
+                done.append(entry.id)
+                QUEUE_DEPTH.inc(key, amount=-1)
+                DELIVERY_DELAY.observe(key, value=time.time() - entry.created)
+                sent.append(entry)
+                if self.on_sent:
+                    self.on_sent(entry)
+                continue
+
+            WEBHOOK_ERRORS.inc(key)
+            retry = not is_permanent(error)
+            (failed if retry else done).append(entry.id)
+            if not retry:
+                QUEUE_DEPTH.inc(key, amount=-1)
+            if self.on_failed:
+                self.on_failed(entry, error, retry)
+
+        self.outbox.remove(done)
+        self.outbox.record_failure(failed)
+        if sent and self.on_round_sent:
+            self.on_round_sent(sent)
+        return not failed
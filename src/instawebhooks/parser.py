@@ -1,9 +1,10 @@
 """Command line argument parser for InstaWebhooks"""
 
-import importlib.metadata
 import re
 from argparse import ArgumentParser
 
+from . import __version__
+
 
 def regex(pattern: str):
     """Argument type for matching a regex pattern"""
@@ -16,10 +17,18 @@ def regex(pattern: str):
     return closure_check_regex
 
 
-try:
-    VERSION = importlib.metadata.version("instawebhooks")
-except importlib.metadata.PackageNotFoundError:
-    VERSION = "unknown"
+USERNAME_PATTERN = r"^[a-zA-Z_](?!.*?\.{2})[\w.]{1,28}[\w]$"
+WEBHOOK_URL_PATTERN = (
+    r"^.*(discord|discordapp)\.com\/api\/webhooks\/([\d]+)\/([a-zA-Z0-9_.-]*)$"
+)
+
+
+def webhook_id(url: str) -> str:
+    """Get the webhook ID from a Discord webhook URL"""
+
+    match = re.match(WEBHOOK_URL_PATTERN, url)
+    return match.group(2) if match else url
+
 
 # Parse command line arguments
 parser = ArgumentParser(
@@ -34,14 +43,21 @@ login_group = parser.add_mutually_exclusive_group()
 parser.add_argument(
     "instagram_username",
     help="the Instagram username to monitor for new posts",
-    type=regex(r"^[a-zA-Z_](?!.*?\.{2})[\w.]{1,28}[\w]$"),
+    type=regex(USERNAME_PATTERN),
+    nargs="?",
 )
 parser.add_argument(
     "discord_webhook_url",
-    help="the Discord webhook URL to send new posts to",
-    type=regex(
-        r"^.*(discord|discordapp)\.com\/api\/webhooks\/([\d]+)\/([a-zA-Z0-9_.-]*)$"
-    ),
+    help="the Discord webhook URLs to send new posts to",
+    type=regex(WEBHOOK_URL_PATTERN),
+    nargs="*",
+)
+parser.add_argument(
+    "-s",
+    "--subscriptions",
+    metavar="FILE",
+    help="JSON file listing the accounts and webhooks to monitor in one process",
+    type=str,
 )
 logging_group.add_argument(
     "-q", "--quiet", help="hide all logging", action="store_true"
@@ -64,6 +80,13 @@ login_group.add_argument(
     type=str,
     help="login to instagram with username and ask for password on terminal",
 )
+parser.add_argument(
+    "--session-file",
+    metavar="FILE",
+    type=str,
+    help="file to load and save the instagram login session, "
+    "defaults to the instaloader session file of the login username",
+)
 parser.add_argument(
     "-p",
     "--catchup",
@@ -79,6 +102,59 @@ parser.add_argument(
     type=int,
     default=3600,
 )
+parser.add_argument(
+    "-a",
+    "--adaptive",
+    help="adapt the refresh interval of each account to how often it posts",
+    action="store_true",
+)
+parser.add_argument(
+    "--min-interval",
+    help="shortest time in seconds between checks of an account when adaptive",
+    metavar="SECONDS",
+    type=int,
+    default=300,
+)
+parser.add_argument(
+    "--max-interval",
+    help="longest time in seconds between checks of an account when adaptive",
+    metavar="SECONDS",
+    type=int,
+    default=21600,
+)
+parser.add_argument(
+    "--requests-per-hour",
+    help="checks per hour shared by all accounts when adaptive, "
+    "defaults to checking every account once per refresh interval",
+    metavar="REQUESTS",
+    type=float,
+)
+parser.add_argument(
+    "--stagger",
+    help="spread the first checks of all accounts evenly over the refresh interval",
+    action="store_true",
+)
+parser.add_argument(
+    "--jitter",
+    help="randomly vary every wait between checks by up to this fraction",
+    metavar="FRACTION",
+    type=float,
+    default=0,
+)
+parser.add_argument(
+    "--backoff-base",
+    help="time in seconds to back off from Instagram after the first error",
+    metavar="SECONDS",
+    type=float,
+    default=60,
+)
+parser.add_argument(
+    "--backoff-max",
+    help="longest time in seconds to back off from Instagram after errors",
+    metavar="SECONDS",
+    type=float,
+    default=3600,
+)
 parser.add_argument(
     "-c",
     "--message-content",
@@ -92,4 +168,86 @@ parser.add_argument(
     help="don't show the post embed and only send message content",
     action="store_true",
 )
-parser.add_argument("--version", action="version", version="%(prog)s " + VERSION)
+parser.add_argument(
+    "-b",
+    "--batch-delay",
+    help="batch posts for the same webhook into as few messages as possible, "
+    "waiting this many seconds for more posts before sending",
+    metavar="SECONDS",
+    type=float,
+)
+parser.add_argument(
+    "--state-file",
+    metavar="FILE",
+    type=str,
+    help="JSON file to remember the last seen post of each account across restarts",
+)
+parser.add_argument(
+    "--outbox",
+    metavar="FILE",
+    type=str,
+    help="SQLite database to keep unsent posts in until Discord accepts them",
+)
+parser.add_argument(
+    "--pool-size",
+    help="maximum number of open HTTP connections shared by all accounts",
+    metavar="CONNECTIONS",
+    type=int,
+    default=100,
+)
+parser.add_argument(
+    "--pool-per-host",
+    help="maximum number of open HTTP connections to a single host",
+    metavar="CONNECTIONS",
+    type=int,
+    default=10,
+)
+parser.add_argument(
+    "--keepalive-timeout",
+    help="time in seconds to keep idle HTTP connections open for reuse",
+    metavar="SECONDS",
+    type=float,
+    default=30,
+)
+parser.add_argument(
+    "--max-downloads",
+    help="maximum number of media files to download at the same time",
+    metavar="DOWNLOADS",
+    type=int,
+    default=8,
+)
+parser.add_argument(
+    "--max-media-size",
+    help="largest media file in megabytes to download and upload to Discord",
+    metavar="MEGABYTES",
+    type=float,
+    default=10,
+)
+parser.add_argument(
+    "--avatar-cache-size",
+    help="maximum number of profile pictures to keep in memory",
+    metavar="ENTRIES",
+    type=int,
+    default=256,
+)
+parser.add_argument(
+    "--avatar-cache-ttl",
+    help="time in seconds before a cached profile picture is revalidated",
+    metavar="SECONDS",
+    type=float,
+    default=86400,
+)
+parser.add_argument(
+    "--avatar-cache-dir",
+    help="directory to also keep cached profile pictures in across restarts",
+    metavar="DIRECTORY",
+    type=str,
+)
+parser.add_argument(
+    "--embed-cache-size",
+    help="megabytes of rendered post embeds and media to keep in memory",
+    metavar="MEGABYTES",
+    type=int,
+    default=64,
+)
+parser.add_argument("--version", action="version", version="%(prog)s " + __version__)
@@ -0,0 +1,98 @@
+"""Token-bucket rate limiting for Discord webhooks."""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, Mapping, Optional
+
+# Webhooks are rate limited by their ID, which is parsed without asyncio so
+# subscriptions can use it at startup
+from .parser import webhook_id  # pylint: disable=unused-import
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    """Read a numeric rate limit header, ignoring malformed values"""
+
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+@dataclass
+class _Bucket:
+    """Token bucket of a single webhook"""
+
+    tokens: float
+    updated: float
+    blocked_until: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class RateLimiter:
+    """Rate limiter for Discord webhooks keyed by webhook ID
+
+    Each webhook gets a local token bucket that allows short bursts and refills
+    at a steady rate. The buckets are corrected with the ``X-RateLimit-*`` and
+    ``Retry-After`` headers Discord sends back, so webhooks shared with other
+    processes are limited by what Discord reports instead of a fixed delay.
+    """
+
+    def __init__(self, capacity: float = 5, per_second: float = 0.5):
+        self.capacity = capacity
+        self.per_second = per_second
+        self._buckets: Dict[str, _Bucket] = {}
+        self._global_blocked_until = 0.0
+
+    def _bucket(self, key: str):
+        """Get or create the bucket for a webhook"""
+
+        if key not in self._buckets:
+            now = asyncio.get_running_loop().time()
+            self._buckets[key] = _Bucket(self.capacity, now)
+        return self._buckets[key]
+
+    async def acquire(self, key: str):
+        """Wait until a request can be sent to a webhook"""
+
+        bucket = self._bucket(key)
+        loop = asyncio.get_running_loop()
+
+        async with bucket.lock:
+            while True:
+                now = loop.time()
+                bucket.tokens = min(
+                    self.capacity,
+                    bucket.tokens + (now - bucket.updated) * self.per_second,
+                )
+                bucket.updated = now
+
+                delay = max(bucket.blocked_until, self._global_blocked_until) - now
+                if delay <= 0 and bucket.tokens < 1:
+                    delay = (1 - bucket.tokens) / self.per_second
+                if delay <= 0:
+                    bucket.tokens -= 1
+                    return
+
+                await asyncio.sleep(delay)
+
+    def update(self, key: str, status: int, headers: Mapping[str, str]):
+        """Update a webhook bucket from the rate limit headers of a response"""
+
+        bucket = self._bucket(key)
+        now = asyncio.get_running_loop().time()
+
+        remaining = _header_float(headers, "X-RateLimit-Remaining")
+        reset_after = _header_float(headers, "X-RateLimit-Reset-After")
+        if remaining is not None:
+            bucket.tokens = min(bucket.tokens, remaining)
+            if remaining < 1 and reset_after is not None:
+                bucket.blocked_until = max(bucket.blocked_until, now + reset_after)
+
+        if status == 429:
+            retry_after = _header_float(headers, "Retry-After")
+            if retry_after is None:
+                retry_after = reset_after if reset_after is not None else 1.0
+            if headers.get("X-RateLimit-Global", "").lower() == "true":
+                self._global_blocked_until = now + retry_after
+            else:
+                bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
@@ -0,0 +1,201 @@
+"""Shared scheduler for checking many Instagram accounts in one event loop."""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import random
+import statistics
+import time
+from collections import deque
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+Job = Callable[[], Coroutine[Any, Any, None]]
+Interval = Union[float, Callable[[str], float]]
+JobErrorHandler = Callable[[str, BaseException], None]
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveInterval:
+    """Polling intervals that follow the posting pattern of each account
+
+    Accounts that post often, or usually post at the current hour of the day,
+    are checked more often while dormant ones back off. The intervals are
+    spread with the square-root rule, which minimizes the average time to
+    detect a new post for a fixed number of requests per hour, and are kept
+    within the minimum and maximum interval.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        requests_per_hour: float,
+        min_interval: float = 300,
+        max_interval: float = 21600,
+        history: int = 50,
+        recent: int = 10,
+    ):
+        self.requests_per_hour = requests_per_hour
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.history = history
+        self.recent = recent
+        self._posts: Dict[str, Deque[float]] = {}
+
+    def add(self, name: str):
+        """Start tracking an account"""
+
+        self._posts.setdefault(name, deque(maxlen=self.history))
+
+    def record(self, name: str, timestamps: List[float]):
+        """Record the UTC timestamps of new posts seen from an account"""
+
+        posts = self._posts.setdefault(name, deque(maxlen=self.history))
+        for timestamp in sorted(set(timestamps) - set(posts)):
+            posts.append(timestamp)
+
+    def activity(self, name: str, now: float) -> float:
+        """Estimate the number of posts per hour an account makes right now"""
+
+        posts = self._posts.get(name)
+        if not posts:
+            # Without any history, assume one post a day
+            return 1 / 24
+
+        # Time between the recent posts, where the median ignores an odd long
+        # break, such as an old post among new ones
+        recent = sorted(posts)[-self.recent :]
+        gaps = [later - earlier for earlier, later in zip(recent, recent[1:])]
+        gap = statistics.median(gaps) if gaps else 86400
+
+        # A silence longer than usual means the account slowed down, and bursts
+        # count as at most one post every half hour
+        gap = max(gap, now - recent[-1], 1800)
+        rate = 3600 / gap
+
+        # Weigh the rate by how often the account posts at this hour of the day
+        hours = [time.gmtime(timestamp).tm_hour for timestamp in posts]
+        current_hour = time.gmtime(now).tm_hour
+        weight = 24 * (hours.count(current_hour) + 1) / (len(hours) + 24)
+
+        return rate * weight
+
+    def __call__(self, name: str) -> float:
+        """Get the time in seconds to wait before checking an account again"""
+
+        now = time.time()
+        scores = {key: math.sqrt(self.activity(key, now)) for key in self._posts}
+        total = sum(scores.values()) or 1
+        requests = self.requests_per_hour * scores.get(name, 0) / total
+
+        interval = 3600 / requests if requests > 0 else self.max_interval
+        return min(max(interval, self.min_interval), self.max_interval)
+
+
+class Scheduler:
+    """Run periodic jobs from a single asyncio event loop
+
+    Jobs are kept in a priority queue ordered by their next due time. A job is
+    only rescheduled once its previous run has finished, so a slow check never
+    overlaps with itself. The interval is either fixed or a function of the job
+    name, such as :class:`AdaptiveInterval`. A jitter spreads every delay by a
+    random fraction so jobs, and other processes, do not fall into lockstep.
+    A job that raises is logged and rescheduled like any other, so one failing
+    job never stops the others.
+    """
+
+    def __init__(
+        self,
+        interval: Interval,
+        jitter: float = 0,
+        on_error: Optional[JobErrorHandler] = None,
+    ):
+        self.interval = interval
+        self.jitter = jitter
+        self.on_error = on_error
+        self._queue: List[Tuple[float, int, str, Job]] = []
+        self._counter = itertools.count()
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def add(self, name: str, job: Job, delay: float = 0):
+        """Schedule a job to first run after a delay in seconds"""
+
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        due = asyncio.get_running_loop().time() + delay
+        heapq.heappush(self._queue, (due, next(self._counter), name, job))
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _on_done(self, name: str, job: Job, task: "asyncio.Task[None]"):
+        """Reschedule a finished job, reporting its error if it failed"""
+
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+
+        error = task.exception()
+        if error is not None:
+            logger.error(
+                "Job '%s' failed, retrying at its next run: %r",
+                name,
+                error,
+                exc_info=error,
+            )
+            if self.on_error:
+                try:
+                    self.on_error(name, error)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.exception("Error in job error handler.")
+        self.add(name, job, self.next_interval(name))
+
+    def next_interval(self, name: str) -> float:
+        """Get the time to wait between two runs of a job"""
+
+        return self.interval(name) if callable(self.interval) else self.interval
+
+    def stagger(self, jobs: List[Tuple[str, Job]]):
+        """Schedule jobs spread evenly over their interval instead of all at once"""
+
+        for index, (name, job) in enumerate(jobs):
+            self.add(name, job, index * self.next_interval(name) / len(jobs))
+
+    async def run(self):
+        """Run the scheduled jobs until cancelled"""
+
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+
+        try:
+            while True:
+                self._wakeup.clear()
+                timeout = self._queue[0][0] - loop.time() if self._queue else None
+                if timeout is None or timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                _, _, name, job = heapq.heappop(self._queue)
+                task = loop.create_task(job())
+                self._tasks.add(task)
+                task.add_done_callback(
+                    lambda done, name=name, job=job: self._on_done(name, job, done)
+                )
+        finally:
+            for task in self._tasks:
+                task.cancel()
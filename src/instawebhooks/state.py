@@ -0,0 +1,56 @@
+"""Persistent polling state of monitored Instagram accounts."""
+
+import json
+import os
+from typing import Dict, NamedTuple, Optional
+
+
+class Cursor(NamedTuple):
+    """The newest post already seen from an account"""
+
+    shortcode: str
+    timestamp: float
+
+
+class CursorStore:
+    """Last-seen post cursors keyed by subscription, optionally saved to a file"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._cursors: Dict[str, Cursor] = {}
+
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+            self._cursors = {
+                key: Cursor(entry["shortcode"], float(entry["timestamp"]))
+                for key, entry in data.items()
+            }
+
+    def get(self, key: str) -> Optional[Cursor]:
+        """Get a cursor, if the subscription was checked before"""
+
+        return self._cursors.get(key)
+
+    def advance(self, key: str, cursor: Cursor):
+        """Move a cursor forward to a newer post and save it"""
+
+        current = self._cursors.get(key)
+        if current and current.timestamp >= cursor.timestamp:
+            return
+        self._cursors[key] = cursor
+        self.save()
+
+    def save(self):
+        """Write the cursors to the state file"""
+
+        if not self.path:
+            return
+
+        data = {key: cursor._asdict() for key, cursor in self._cursors.items()}
+
+        # Write to a temporary file first so a crash never leaves a broken file
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=2)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,62 @@
+"""Subscriptions of Instagram accounts to Discord webhooks."""
+
+import json
+import re
+from typing import Any, List, NamedTuple
+
+from .parser import USERNAME_PATTERN, WEBHOOK_URL_PATTERN, webhook_id
+
+
+class Subscription(NamedTuple):
+    """An Instagram account mirrored to a Discord webhook"""
+
+    instagram_username: str
+    discord_webhook_url: str
+    message_content: str = ""
+    no_embed: bool = False
+
+    @property
+    def key(self) -> str:
+        """Identify the subscription by its username and webhook ID"""
+
+        return f"{self.instagram_username}:{webhook_id(self.discord_webhook_url)}"
+
+
+def parse_subscription(
+    entry: Any, message_content: str = "", no_embed: bool = False
+) -> Subscription:
+    """Create a subscription from a JSON object, using defaults for missing keys"""
+
+    if not isinstance(entry, dict):
+        raise ValueError(f"invalid subscription: {entry!r}")
+
+    username = entry.get("instagram_username", "")
+    webhook_url = entry.get("discord_webhook_url", "")
+
+    if not isinstance(username, str) or not re.match(USERNAME_PATTERN, username):
+        raise ValueError(f"invalid Instagram username: '{username}'")
+    if not isinstance(webhook_url, str) or not re.match(
+        WEBHOOK_URL_PATTERN, webhook_url
+    ):
+        raise ValueError(f"invalid Discord webhook URL for '{username}'")
+
+    return Subscription(
+        instagram_username=username,
+        discord_webhook_url=webhook_url,
+        message_content=str(entry.get("message_content", message_content)),
+        no_embed=bool(entry.get("no_embed", no_embed)),
+    )
+
+
+def load_subscriptions(
+    path: str, message_content: str = "", no_embed: bool = False
+) -> List[Subscription]:
+    """Load a list of subscriptions from a JSON file"""
+
+    with open(path, encoding="utf-8") as file:
+        entries = json.load(file)
+
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path} must contain a non-empty list of subscriptions")
+
+    return [parse_subscription(entry, message_content, no_embed) for entry in entries]
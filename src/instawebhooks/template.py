@@ -0,0 +1,62 @@
+"""Message templates with placeholders for the post information."""
+
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+from instaloader.structures import Post
+
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
+
+POST_TYPES = {"GraphImage": "image", "GraphVideo": "video", "GraphSidecar": "carousel"}
+
+# Values of the placeholders, only computed when a template uses them
+PLACEHOLDERS: Dict[str, Callable[[Post], str]] = {
+    "post_url": lambda post: f"https://www.instagram.com/p/{post.shortcode}/",
+    "owner_url": lambda post: f"https://www.instagram.com/{post.owner_username}/",
+    "owner_name": lambda post: post.owner_profile.full_name,
+    "owner_username": lambda post: post.owner_username,
+    "post_caption": lambda post: post.caption or "",
+    "post_shortcode": lambda post: post.shortcode,
+    "post_image_url": lambda post: post.url,
+    "post_date": lambda post: post.date_utc.strftime("%Y-%m-%d %H:%M UTC"),
+    "post_timestamp": lambda post: str(int(post.date_utc.timestamp())),
+    "post_type": lambda post: POST_TYPES.get(post.typename, "post"),
+}
+
+
+def _escape(text: str) -> str:
+    """Escape braces so text is kept as it is in a format string"""
+
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+@lru_cache(maxsize=None)
+def compile_template(template: str) -> Callable[[Post], str]:
+    """Compile a message template into a function that renders it for a post
+
+    The template is turned into a format string once, so rendering a post is
+    a single pass that never changes the template. Unknown placeholders are
+    kept as they are.
+    """
+
+    format_string = ""
+    getters: List[Callable[[Post], str]] = []
+    position = 0
+
+    for match in PLACEHOLDER_PATTERN.finditer(template):
+        getter = PLACEHOLDERS.get(match.group(1))
+        if getter is None:
+            continue
+        format_string += _escape(template[position : match.start()]) + "{}"
+        getters.append(getter)
+        position = match.end()
+    format_string += _escape(template[position:])
+
+    if not getters:
+        return lambda post: template
+
+    def render(post: Post) -> str:
+        return format_string.format(*[getter(post) for getter in getters])
+
+    return render
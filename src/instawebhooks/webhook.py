@@ -0,0 +1,91 @@
+"""Asynchronous Discord webhook delivery built on aiohttp."""
+
+import json
+import time
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from aiohttp import ClientSession, FormData
+
+from .metrics import WEBHOOK_RATE_LIMITED, WEBHOOK_SECONDS
+from .ratelimit import RateLimiter, webhook_id
+
+# Number of times a rate limited request is retried before giving up
+MAX_RATE_LIMIT_RETRIES = 5
+
+Attachment = Tuple[str, bytes]
+
+
+class WebhookError(Exception):
+    """Raised when Discord rejects a webhook request"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class Message(NamedTuple):
+    """A webhook message with its embeds and file attachments"""
+
+    content: str = ""
+    embeds: Sequence[Dict[str, Any]] = ()
+    attachments: Sequence[Attachment] = ()
+
+
+def build_payload(message: Message):
+    """Build the request body for executing a webhook"""
+
+    payload: Dict[str, Any] = {"content": message.content}
+    if message.embeds:
+        payload["embeds"] = list(message.embeds)
+
+    if not message.attachments:
+        return payload
+
+    # Attachments are sent as multipart form data with the JSON payload
+    form = FormData()
+    form.add_field("payload_json", json.dumps(payload), content_type="application/json")
+    for index, (filename, data) in enumerate(message.attachments):
+        form.add_field(
+            f"files[{index}]",
+            data,
+            filename=filename,
+            content_type="application/octet-stream",
+        )
+    return form
+
+
+async def execute_webhook(
+    session: ClientSession,
+    url: str,
+    message: Message,
+    rate_limiter: Optional[RateLimiter] = None,
+):
+    """Send a message with embeds and attachments to a Discord webhook"""
+
+    key = webhook_id(url)
+
+    for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+        if rate_limiter:
+            await rate_limiter.acquire(key)
+
+        # Form data can only be sent once, so the body is rebuilt on every retry
+        body = build_payload(message)
+        if isinstance(body, FormData):
+            request = session.post(url, data=body)
+        else:
+            request = session.post(url, json=body)
+
+        started = time.perf_counter()
+        async with request as res:
+            WEBHOOK_SECONDS.observe(key, value=time.perf_counter() - started)
+            if rate_limiter:
+                rate_limiter.update(key, res.status, res.headers)
+            if res.status == 429:
+                WEBHOOK_RATE_LIMITED.inc(key)
+                if rate_limiter:
+                    continue
+            if res.status >= 400:
+                raise WebhookError(res.status, await res.text())
+            return
+
+    raise WebhookError(429, "rate limited by Discord")
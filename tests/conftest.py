@@ -0,0 +1,170 @@
+"""Shared fixtures, including a local fake Discord webhook server."""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Tuple
+
+import pytest
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+
+class FakeDiscord:
+    """Webhook endpoint answering with scripted statuses and headers
+
+    Requests without a scripted response succeed. The time of every request
+    and the payload of every delivered message are recorded.
+    """
+
+    def __init__(self):
+        self.responses: Dict[str, List[web.Response]] = {}
+        self.requests: List[Tuple[str, float]] = []
+        self.messages: List[Tuple[str, Dict[str, Any]]] = []
+        self.app = web.Application()
+        self.app.router.add_post("/api/webhooks/{webhook_id}/{token}", self.execute)
+
+    def script(self, webhook_id: str, *responses: web.Response):
+        """Set the responses of the next requests to a webhook"""
+
+        self.responses.setdefault(webhook_id, []).extend(responses)
+
+    def rate_limit(self, webhook_id: str, retry_after: float, is_global=False):
+        """Answer the next request to a webhook with a 429 like Discord does"""
+
+        headers = {"Retry-After": str(retry_after)}
+        if is_global:
+            headers["X-RateLimit-Global"] = "true"
+        self.script(
+            webhook_id,
+            web.json_response(
+                {"message": "You are being rate limited.", "retry_after": retry_after},
+                status=429,
+                headers=headers,
+            ),
+        )
+
+    def fail(self, webhook_id: str, status: int = 500, count: int = 1):
+        """Answer the next requests to a webhook with an error"""
+
+        self.script(webhook_id, *(web.Response(status=status) for _ in range(count)))
+
+    async def execute(self, request: web.Request) -> web.Response:
+        """Handle a webhook request"""
+
+        webhook_id = request.match_info["webhook_id"]
+        self.requests.append((webhook_id, asyncio.get_running_loop().time()))
+
+        responses = self.responses.get(webhook_id)
+        if responses:
+            return responses.pop(0)
+
+        if request.content_type == "multipart/form-data":
+            form = await request.post()
+            payload_json = form["payload_json"]
+            if isinstance(payload_json, web.FileField):
+                payload_json = payload_json.file.read().decode()
+            payload = json.loads(payload_json)
+            payload["files"] = [
+                field.filename for name, field in form.items() if name != "payload_json"
+            ]
+        else:
+            payload = await request.json()
+        self.messages.append((webhook_id, payload))
+        return web.Response(status=204)
+
+
+class FakeCDN:
+    """Media server answering conditional requests by ETag
+
+    Files requested with ``?chunked`` are streamed without a Content-Length,
+    like a CDN that does not know their size in advance. The headers of every
+    request are recorded.
+    """
+
+    def __init__(self):
+        self.files: Dict[str, Tuple[bytes, str]] = {}
+        self.requests: List[Tuple[str, Dict[str, str]]] = []
+        self.app = web.Application()
+        self.app.router.add_get("/{name}", self.get)
+
+    def add(self, name: str, data: bytes, etag: str = ""):
+        """Serve a file, with an ETag if given"""
+
+        self.files[name] = (data, etag)
+
+    async def get(self, request: web.Request) -> web.StreamResponse:
+        """Handle a media request"""
+
+        name = request.match_info["name"]
+        self.requests.append((name, dict(request.headers)))
+        data, etag = self.files[name]
+        headers = {"ETag": etag} if etag else {}
+
+        if etag and request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        if request.query.get("chunked") is None:
+            return web.Response(body=data, headers=headers)
+
+        response = web.StreamResponse(headers=headers)
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for start in range(0, len(data), 1024):
+            await response.write(data[start : start + 1024])
+        await response.write_eof()
+        return response
+
+
+@pytest.fixture
+def with_cdn():
+    """Run a test coroutine with a fake media server and a client session
+
+    The coroutine is called with the server, the session and a function
+    creating the URL of a file by its name.
+    """
+
+    def run(test):
+        async def main():
+            cdn = FakeCDN()
+            server = TestServer(cdn.app)
+            await server.start_server()
+            try:
+                async with ClientSession() as session:
+
+                    def url(name: str) -> str:
+                        return str(server.make_url(f"/{name}"))
+
+                    await test(cdn, session, url)
+            finally:
+                await server.close()
+
+        asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def with_discord():
+    """Run a test coroutine with a fake Discord server and a client session
+
+    The coroutine is called with the server, the session and a function
+    creating the URL of a webhook by its ID.
+    """
+
+    def run(test):
+        async def main():
+            discord = FakeDiscord()
+            server = TestServer(discord.app)
+            await server.start_server()
+            try:
+                async with ClientSession() as session:
+
+                    def url(webhook_id: str) -> str:
+                        return str(server.make_url(f"/api/webhooks/{webhook_id}/token"))
+
+                    await test(discord, session, url)
+            finally:
+                await server.close()
+
+        asyncio.run(main())
+
+    return run
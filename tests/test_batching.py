@@ -0,0 +1,117 @@
+"""Tests for ordered and batched webhook delivery."""
+
+import asyncio
+
+import pytest
+
+from instawebhooks.batching import (
+    MAX_EMBEDS,
+    WebhookBatcher,
+    fits_in_one_message,
+    merge_messages,
+)
+from instawebhooks.ratelimit import RateLimiter
+from instawebhooks.webhook import Message, WebhookError
+
+
+def post_message(shortcode: str) -> Message:
+    """A message with an embed, a post image and the profile picture"""
+
+    return Message(
+        shortcode,
+        [{"title": shortcode, "image": {"url": "attachment://post_image.webp"}}],
+        [("post_image.webp", shortcode.encode()), ("profile_pic.webp", b"avatar")],
+    )
+
+
+def test_merged_messages_keep_their_order_and_share_files():
+    merged = merge_messages([post_message("first"), post_message("second")])
+
+    assert merged.content == "first\nsecond"
+    assert [embed["title"] for embed in merged.embeds] == ["first", "second"]
+
+    # Post images are renamed apart, the shared profile picture is sent once
+    assert [filename for filename, _ in merged.attachments] == [
+        "0_post_image.webp",
+        "0_profile_pic.webp",
+        "1_post_image.webp",
+    ]
+    assert [embed["image"]["url"] for embed in merged.embeds] == [
+        "attachment://0_post_image.webp",
+        "attachment://1_post_image.webp",
+    ]
+
+
+def test_messages_over_the_embed_limit_do_not_fit():
+    messages = [Message(embeds=[{"title": str(index)}]) for index in range(MAX_EMBEDS)]
+
+    assert fits_in_one_message(messages)
+    assert not fits_in_one_message(messages + [Message(embeds=[{"title": "more"}])])
+
+
+def test_queued_messages_are_batched_in_order(with_discord):
+    async def test(discord, session, url):
+        batcher = WebhookBatcher(session, RateLimiter(), batch_delay=0.05)
+        futures = [
+            batcher.submit(url("1"), Message(content))
+            for content in ["first", "second", "third"]
+        ]
+        await asyncio.gather(*futures)
+
+        assert discord.messages == [("1", {"content": "first\nsecond\nthird"})]
+
+    with_discord(test)
+
+
+def test_messages_are_sent_one_by_one_without_batching(with_discord):
+    async def test(discord, session, url):
+        batcher = WebhookBatcher(session, RateLimiter())
+        futures = [
+            batcher.submit(url("1"), Message(content))
+            for content in ["first", "second", "third"]
+        ]
+        await asyncio.gather(*futures)
+
+        assert [payload["content"] for _, payload in discord.messages] == [
+            "first",
+            "second",
+            "third",
+        ]
+
+    with_discord(test)
+
+
+def test_failed_message_is_never_overtaken(with_discord):
+    async def test(discord, session, url):
+        discord.fail("1", status=500)
+        batcher = WebhookBatcher(session, RateLimiter())
+        futures = [
+            batcher.submit(url("1"), Message(content))
+            for content in ["first", "second", "third"]
+        ]
+        await asyncio.wait(futures)
+
+        with pytest.raises(WebhookError):
+            futures[0].result()
+        assert all(future.cancelled() for future in futures[1:])
+
+        # Nothing queued after the failed message was sent
+        assert len(discord.requests) == 1
+        assert not discord.messages
+
+    with_discord(test)
+
+
+def test_webhooks_are_delivered_independently(with_discord):
+    async def test(discord, session, url):
+        discord.fail("1", status=500)
+        batcher = WebhookBatcher(session, RateLimiter())
+        failing = batcher.submit(url("1"), Message("failing"))
+        working = batcher.submit(url("2"), Message("working"))
+        await asyncio.wait([failing, working])
+
+        assert isinstance(failing.exception(), WebhookError)
+        assert working.result() is None
+        assert discord.messages == [("2", {"content": "working"})]
+
+    with_discord(test)
@@ -0,0 +1,135 @@
+"""Tests for backing off from Instagram with circuit breakers."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import requests
+from instaloader.exceptions import (
+    ConnectionException,
+    QueryReturnedNotFoundException,
+    TooManyRequestsException,
+)
+
+from instawebhooks import breaker as breaker_module
+from instawebhooks.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from instawebhooks.config import Config
+from instawebhooks.monitor import Monitor, create_loader, is_throttling
+from instawebhooks.subscriptions import Subscription
+
+WEBHOOK_URL = "https://discord.com/api/webhooks/123/token"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the monotonic clock of the breakers with one set by the test"""
+
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(breaker_module.time, "monotonic", lambda: now.value)
+    monkeypatch.setattr(breaker_module.random, "uniform", lambda low, high: 1)
+    return now
+
+
+def test_breaker_backs_off_exponentially(clock):
+    breaker = CircuitBreaker(base_delay=60, max_delay=200)
+
+    for delay in [60, 120, 200, 200]:
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert breaker.retry_after() == delay
+
+
+def test_open_breaker_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker(base_delay=60)
+    breaker.record_failure()
+
+    assert not breaker.ready()
+    assert not breaker.allow()
+
+    clock.value += 60
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+    # Only one probe at a time until it reports back
+    assert not breaker.allow()
+
+
+def test_failed_probe_reopens_with_a_longer_backoff(clock):
+    breaker = CircuitBreaker(base_delay=60)
+    breaker.record_failure()
+    clock.value += 60
+    breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 120
+
+
+def test_successful_probe_closes_the_breaker(clock):
+    breaker = CircuitBreaker(base_delay=60)
+    breaker.record_failure()
+    clock.value += 60
+    breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+    # The backoff starts over after the breaker closed
+    breaker.record_failure()
+    assert breaker.retry_after() == 60
+
+
+def test_instaloader_gives_up_on_429_without_sleeping(monkeypatch):
+    loader = create_loader()
+    loader.context.sleep = False
+    sleeps = []
+    monkeypatch.setattr(
+        loader.context._rate_controller,  # pylint: disable=protected-access
+        "sleep",
+        sleeps.append,
+    )
+
+    response = requests.Response()
+    response.status_code = 429
+    response.reason = "Too Many Requests"
+    response.headers["Content-Type"] = "text/html"
+    session = loader.context._session  # pylint: disable=protected-access
+    monkeypatch.setattr(session, "get", lambda *args, **kwargs: response)
+
+    with pytest.raises(ConnectionException) as error:
+        loader.context.get_json("graphql/query", {"query_hash": "hash"})
+
+    assert isinstance(error.value.__cause__, TooManyRequestsException)
+    assert is_throttling(error.value)
+    assert not sleeps
+
+
+def fetch_failing_with(error):
+    """Check an account with a monitor whose fetch raises an error"""
+
+    monitor = Monitor(Config(), [Subscription("raenlua", WEBHOOK_URL)])
+
+    def fetch_new_posts(username, cursor, catchup=0):
+        raise error
+
+    monitor.fetch_new_posts = fetch_new_posts
+    asyncio.run(monitor.fetch_with_backoff("raenlua", None))
+    monitor.close()
+    return monitor
+
+
+def test_429_opens_the_instagram_breaker():
+    error = ConnectionException("JSON Query to graphql/query: 429")
+    error.__cause__ = TooManyRequestsException("429 Too Many Requests")
+    monitor = fetch_failing_with(error)
+
+    assert monitor.instagram_breaker.state == OPEN
+    assert monitor.account_breakers["raenlua"].state != OPEN
+
+
+def test_account_error_only_opens_the_account_breaker():
+    monitor = fetch_failing_with(QueryReturnedNotFoundException("404 Not Found"))
+
+    assert monitor.instagram_breaker.state != OPEN
+    assert monitor.account_breakers["raenlua"].state == OPEN
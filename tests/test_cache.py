@@ -0,0 +1,42 @@
+"""Tests for the caches of profile pictures and rendered posts."""
+
+from instawebhooks.cache import SizedCache
+
+
+def test_least_recently_used_values_are_evicted_by_size():
+    cache: SizedCache[bytes] = SizedCache(10, len)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+
+    # "b" was used least recently, so it makes room for "c"
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+    assert cache.total_size == 8
+
+
+def test_replacing_a_value_updates_the_size():
+    cache: SizedCache[bytes] = SizedCache(10, len)
+    cache.put("a", b"aaaa")
+    cache.put("a", b"aaaaaaaa")
+
+    assert cache.get("a") == b"aaaaaaaa"
+    assert cache.total_size == 8
+
+
+def test_value_too_large_to_store_is_not_cached():
+    cache: SizedCache[bytes] = SizedCache(10, len)
+    cache.put("a", b"aaaa")
+    cache.put("big", b"x" * 11)
+
+    # Nothing is evicted to make room for a value that could never fit
+    assert cache.get("big") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.total_size == 4
+
+    # Replacing a value with one too large drops the old value
+    cache.put("a", b"x" * 11)
+    assert cache.get("a") is None
+    assert cache.total_size == 0
@@ -0,0 +1,51 @@
+"""Tests for formatting captions with links."""
+
+from instawebhooks.caption import ELLIPSIS, MAX_DESCRIPTION_LENGTH, format_caption
+
+TAG_URL = "https://www.instagram.com/explore/tags/"
+
+
+def test_hashtags_and_mentions_are_linked():
+    assert format_caption("Sunny #summer with @raenlua.") == (
+        f"Sunny [#summer]({TAG_URL}summer) with "
+        "[@raenlua](https://www.instagram.com/raenlua)."
+    )
+
+
+def test_link_on_the_limit_is_left_out():
+    text = "a" * (MAX_DESCRIPTION_LENGTH - 10)
+    formatted = format_caption(f"{text} #summer")
+
+    # The link would end past the limit, so it is dropped instead of cut
+    assert len(formatted) <= MAX_DESCRIPTION_LENGTH
+    assert formatted == text + ELLIPSIS
+
+
+def test_link_that_fits_is_kept_whole():
+    link = f"[#summer]({TAG_URL}summer)"
+    text = "a" * (MAX_DESCRIPTION_LENGTH - len(link) - len(ELLIPSIS) - 1)
+    formatted = format_caption(f"{text} #summer and more text")
+
+    assert len(formatted) <= MAX_DESCRIPTION_LENGTH
+    assert formatted == f"{text} {link}{ELLIPSIS}"
+
+
+def test_caption_on_the_limit_is_not_cut():
+    text = "a" * MAX_DESCRIPTION_LENGTH
+    assert format_caption(text) == text
+
+
+def test_url_anchors_are_not_hashtags():
+    caption = "Read https://example.com/page#section and &#39; too"
+    assert format_caption(caption) == caption
+
+
+def test_email_addresses_are_not_mentions():
+    caption = "Write to hello@example.com or a@b"
+    assert format_caption(caption) == caption
+
+
+def test_non_ascii_hashtags_are_quoted():
+    assert format_caption("#café #日本") == (
+        f"[#café]({TAG_URL}caf%C3%A9) [#日本]({TAG_URL}%E6%97%A5%E6%9C%AC)"
+    )
@@ -0,0 +1,78 @@
+"""Tests for downloading post media and profile pictures."""
+
+import pytest
+
+from instawebhooks.cache import ProfilePictureCache
+from instawebhooks.media import MediaDownloader, MediaTooLargeError
+
+
+def test_profile_picture_is_cached_and_revalidated(with_cdn):
+    async def test(cdn, session, url):
+        cdn.add("avatar.jpg", b"old picture", etag='"v1"')
+        cache = ProfilePictureCache(ttl=3600)
+        downloader = MediaDownloader(session, profile_pics=cache)
+
+        # A fresh entry is used without asking the CDN
+        assert await downloader.fetch_profile_pic("raenlua", url("avatar.jpg")) == (
+            b"old picture"
+        )
+        assert await downloader.fetch_profile_pic("raenlua", url("avatar.jpg")) == (
+            b"old picture"
+        )
+        assert len(cdn.requests) == 1
+        assert "If-None-Match" not in cdn.requests[0][1]
+
+        # A stale entry is revalidated, and a 304 keeps the cached bytes
+        entry = cache.get("raenlua", url("avatar.jpg"))
+        cache.put("raenlua", url("avatar.jpg"), entry._replace(fetched_at=0))
+        cdn.add("avatar.jpg", b"new picture", etag='"v1"')
+        assert await downloader.fetch_profile_pic("raenlua", url("avatar.jpg")) == (
+            b"old picture"
+        )
+        assert len(cdn.requests) == 2
+        assert cdn.requests[1][1]["If-None-Match"] == '"v1"'
+
+        # The revalidated entry is fresh again
+        assert cache.is_fresh(cache.get("raenlua", url("avatar.jpg")))
+        await downloader.fetch_profile_pic("raenlua", url("avatar.jpg"))
+        assert len(cdn.requests) == 2
+
+    with_cdn(test)
+
+
+def test_changed_profile_picture_replaces_the_cached_one(with_cdn):
+    async def test(cdn, session, url):
+        cdn.add("avatar.jpg", b"old picture", etag='"v1"')
+        cache = ProfilePictureCache(ttl=3600)
+        downloader = MediaDownloader(session, profile_pics=cache)
+        await downloader.fetch_profile_pic("raenlua", url("avatar.jpg"))
+
+        entry = cache.get("raenlua", url("avatar.jpg"))
+        cache.put("raenlua", url("avatar.jpg"), entry._replace(fetched_at=0))
+        cdn.add("avatar.jpg", b"new picture", etag='"v2"')
+
+        assert await downloader.fetch_profile_pic("raenlua", url("avatar.jpg")) == (
+            b"new picture"
+        )
+        assert cache.get("raenlua", url("avatar.jpg")).etag == '"v2"'
+
+    with_cdn(test)
+
+
+def test_oversized_chunked_media_is_skipped(with_cdn):
+    async def test(cdn, session, url):
+        cdn.add("small.jpg", b"s" * 3000)
+        cdn.add("large.jpg", b"l" * 5000)
+        downloader = MediaDownloader(session, max_size=4096)
+
+        # Without a Content-Length, the size is only known while reading
+        with pytest.raises(MediaTooLargeError):
+            await downloader.fetch(url("large.jpg?chunked"))
+        assert await downloader.fetch(url("small.jpg?chunked")) == b"s" * 3000
+
+        files = await downloader.fetch_all(
+            [url("small.jpg?chunked"), url("large.jpg?chunked"), url("small.jpg")]
+        )
+        assert files == [b"s" * 3000, b"s" * 3000]
+
+    with_cdn(test)
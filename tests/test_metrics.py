@@ -0,0 +1,59 @@
+"""Tests for rendering metrics in the Prometheus text format."""
+
+import pytest
+
+from instawebhooks import metrics
+from instawebhooks.metrics import Counter, Gauge, Histogram, Metric
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    """Keep the metrics of a test out of the registry of the package"""
+
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+
+
+def test_metric_without_samples_cannot_be_created():
+    with pytest.raises(TypeError):
+        Metric("instawebhooks_test", "A metric without samples")  # type: ignore
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(
+        "instawebhooks_test_seconds", "Test latencies", ["account"], buckets=[1, 5]
+    )
+    for value in [0.5, 1, 3, 10]:
+        histogram.observe("raenlua", value=value)
+
+    assert histogram.render() == (
+        "# HELP instawebhooks_test_seconds Test latencies\n"
+        "# TYPE instawebhooks_test_seconds histogram\n"
+        'instawebhooks_test_seconds_bucket{account="raenlua",le="1.0"} 2.0\n'
+        'instawebhooks_test_seconds_bucket{account="raenlua",le="5.0"} 3.0\n'
+        'instawebhooks_test_seconds_bucket{account="raenlua",le="+Inf"} 4.0\n'
+        'instawebhooks_test_seconds_sum{account="raenlua"} 14.5\n'
+        'instawebhooks_test_seconds_count{account="raenlua"} 4.0\n'
+    )
+
+
+def test_label_values_are_escaped():
+    counter = Counter("instawebhooks_test_total", "Test events", ["account"])
+    counter.inc('back\\slash "quoted"\nnewline', amount=2)
+
+    assert counter.render().splitlines()[-1] == (
+        'instawebhooks_test_total{account="back\\\\slash \\"quoted\\"\\nnewline"} 2.0'
+    )
+
+
+def test_registry_renders_every_metric():
+    Counter("instawebhooks_test_total", "Test events").inc()
+    Gauge("instawebhooks_test_messages", "Test queue").set(value=3)
+
+    assert metrics.render() == (
+        "# HELP instawebhooks_test_total Test events\n"
+        "# TYPE instawebhooks_test_total counter\n"
+        "instawebhooks_test_total 1.0\n"
+        "# HELP instawebhooks_test_messages Test queue\n"
+        "# TYPE instawebhooks_test_messages gauge\n"
+        "instawebhooks_test_messages 3.0\n"
+    )
@@ -0,0 +1,202 @@
+"""Tests for queueing new posts of the monitor."""
+
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from aiohttp import ClientError
+
+from instawebhooks.config import Config
+from instawebhooks.monitor import MAX_BUILD_ATTEMPTS, Monitor, Timeline, post_cursor
+from instawebhooks.subscriptions import Subscription
+from instawebhooks.webhook import Message
+
+WEBHOOK_URL = "https://discord.com/api/webhooks/123/token"
+
+
+class FakeDelivery:
+    """Outbox delivery that records the queued messages"""
+
+    def __init__(self):
+        self.queued = []
+
+    def put(self, url, message, label=""):
+        self.queued.append((url, label))
+        return len(self.queued)
+
+
+def make_post(shortcode, hour):
+    return SimpleNamespace(
+        shortcode=shortcode,
+        date_utc=datetime(2024, 7, 1, hour, tzinfo=timezone.utc),
+    )
+
+
+def make_monitor(timeline, failing):
+    """Create a monitor reading a fixed timeline, failing to build some posts"""
+
+    monitor = Monitor(Config(), [Subscription("raenlua", WEBHOOK_URL)])
+
+    async def fetch_with_backoff(username, cursor, catchup=0):
+        return timeline
+
+    async def create_messages(downloader, post, receivers):
+        if post.shortcode in failing:
+            raise ClientError("503 from the CDN")
+        return [Message(post.shortcode) for _ in receivers]
+
+    monitor.fetch_with_backoff = fetch_with_backoff
+    monitor.create_messages = create_messages
+    return monitor
+
+
+def check(monitor, delivery):
+    asyncio.run(
+        monitor.check_for_new_posts(
+            delivery, None, "raenlua", monitor.subscriptions, catchup=0
+        )
+    )
+
+
+def test_post_that_fails_to_build_is_retried_in_order():
+    old, first, second, third = (
+        make_post(code, hour)
+        for code, hour in [("old", 1), ("first", 2), ("second", 3), ("third", 4)]
+    )
+    timeline = Timeline([third, second, first], [], post_cursor(third), [])
+    monitor = make_monitor(timeline, failing={"second"})
+    key = monitor.subscriptions[0].key
+    monitor.cursors.advance(key, post_cursor(old))
+
+    delivery = FakeDelivery()
+    check(monitor, delivery)
+
+    # The cursor stops before the failed post, so neither it nor later posts are lost
+    assert [label for _, label in delivery.queued] == ["first"]
+    assert monitor.cursors.get(key) == post_cursor(first)
+
+    monitor.create_messages = make_monitor(timeline, failing=set()).create_messages
+    check(monitor, delivery)
+
+    assert [label for _, label in delivery.queued] == ["first", "second", "third"]
+    assert monitor.cursors.get(key) == post_cursor(third)
+    monitor.close()
+
+
+def test_cursor_moves_to_newest_post_when_everything_is_queued():
+    old, new = make_post("old", 1), make_post("new", 2)
+    timeline = Timeline([new], [], post_cursor(new), [])
+    monitor = make_monitor(timeline, failing=set())
+    key = monitor.subscriptions[0].key
+    monitor.cursors.advance(key, post_cursor(old))
+
+    delivery = FakeDelivery()
+    check(monitor, delivery)
+
+    assert delivery.queued == [(WEBHOOK_URL, "new")]
+    assert monitor.cursors.get(key) == post_cursor(new)
+    monitor.close()
+
+
+def test_only_posts_after_the_cursor_are_timed():
+    pinned, old, first, second = (
+        make_post(code, hour)
+        for code, hour in [("pinned", 0), ("old", 1), ("first", 2), ("second", 3)]
+    )
+    monitor = Monitor(Config(), [Subscription("raenlua", WEBHOOK_URL)])
+    profile = SimpleNamespace(get_posts=lambda: iter([pinned, second, first, old]))
+    monitor.get_profile = lambda username: profile
+
+    timeline = monitor.fetch_new_posts("raenlua", post_cursor(old))
+
+    # The pinned post is older than the cursor, so it does not skew the estimate
+    assert timeline.new_posts == [second, first]
+    assert sorted(timeline.post_times) == [
+        first.date_utc.timestamp(),
+        second.date_utc.timestamp(),
+    ]
+
+    # Without a cursor, only the newest post is timed
+    timeline = monitor.fetch_new_posts("raenlua", None)
+    assert timeline.post_times == [second.date_utc.timestamp()]
+    monitor.close()
+
+
+def test_stop_before_run_is_not_lost():
+    monitor = Monitor(Config(), [Subscription("raenlua", WEBHOOK_URL)])
+    checked = []
+    monitor.poll_account = lambda *args: checked.append(args)
+
+    # A stop sent while the monitor is still being set up ends it right away
+    monitor.stop()
+    monitor.run_forever()
+
+    assert not checked
+
+
+def test_post_that_keeps_failing_is_sent_without_media():
+    old, first, broken, third = (
+        make_post(code, hour)
+        for code, hour in [("old", 1), ("first", 2), ("broken", 3), ("third", 4)]
+    )
+    timeline = Timeline([third, broken, first], [], post_cursor(third), [])
+    monitor = make_monitor(timeline, failing={"broken"})
+    key = monitor.subscriptions[0].key
+    monitor.cursors.advance(key, post_cursor(old))
+    errors = []
+    monitor.on_error = lambda source, error: errors.append(source)
+
+    delivery = FakeDelivery()
+    for _ in range(MAX_BUILD_ATTEMPTS):
+        check(monitor, delivery)
+
+    # The broken post goes out as a link, and the posts after it are not held up
+    assert [label for _, label in delivery.queued] == ["first", "broken", "third"]
+    assert monitor.cursors.get(key) == post_cursor(third)
+    assert errors == ["raenlua"] * MAX_BUILD_ATTEMPTS
+    assert not monitor.build_failures
+    monitor.close()
+
+
+def test_subscriptions_behind_each_other_get_only_their_unseen_posts():
+    old, first, second = (
+        make_post(code, hour)
+        for code, hour in [("old", 1), ("first", 2), ("second", 3)]
+    )
+    other_url = "https://discord.com/api/webhooks/456/token"
+    behind = Subscription("raenlua", WEBHOOK_URL)
+    ahead = Subscription("raenlua", other_url)
+    monitor = Monitor(Config(), [behind, ahead])
+    monitor.cursors.advance(behind.key, post_cursor(old))
+    monitor.cursors.advance(ahead.key, post_cursor(first))
+
+    cursors = []
+    embeds = []
+
+    async def fetch_with_backoff(username, cursor, catchup=0):
+        cursors.append(cursor)
+        return Timeline([second, first], [], post_cursor(second), [])
+
+    async def create_embed(downloader, post):
+        embeds.append(post.shortcode)
+        return [], []
+
+    monitor.fetch_with_backoff = fetch_with_backoff
+    monitor.create_embed = create_embed
+
+    delivery = FakeDelivery()
+    check(monitor, delivery)
+
+    # The account is read back to the subscription furthest behind
+    assert cursors == [post_cursor(old)]
+    assert delivery.queued == [
+        (WEBHOOK_URL, "first"),
+        (WEBHOOK_URL, "second"),
+        (other_url, "second"),
+    ]
+
+    # The post both subscriptions receive is only built once
+    assert embeds == ["first", "second"]
+    assert monitor.cursors.get(behind.key) == post_cursor(second)
+    assert monitor.cursors.get(ahead.key) == post_cursor(second)
+    monitor.close()
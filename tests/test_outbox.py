@@ -0,0 +1,161 @@
+"""Tests for the durable outbox and its delivery workers."""
+
+import asyncio
+
+from instawebhooks.batching import WebhookBatcher
+from instawebhooks.outbox import Outbox, OutboxDelivery
+from instawebhooks.ratelimit import RateLimiter
+from instawebhooks.webhook import Message
+
+
+def image_message(content: str, size: int) -> Message:
+    """A message with a single attachment of a given size"""
+
+    return Message(content, [], [(f"{content}.webp", content.encode() * size)])
+
+
+async def drain(delivery: OutboxDelivery, outbox: Outbox, timeout: float = 2):
+    """Wait until every queued message was delivered or rejected"""
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while outbox.counts() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    delivery.close()
+
+
+def test_messages_are_delivered_in_order_after_a_failure(with_discord):
+    sent = []
+    failed = []
+
+    async def test(discord, session, url):
+        discord.fail("1", status=503)
+        outbox = Outbox()
+        delivery = OutboxDelivery(
+            outbox,
+            WebhookBatcher(session, RateLimiter()),
+            on_sent=lambda entry: sent.append(entry.label),
+            on_failed=lambda entry, error, retry: failed.append((entry.label, retry)),
+            base_delay=0.05,
+        )
+        for label in ["first", "second", "third"]:
+            delivery.put(url("1"), Message(label), label)
+        await drain(delivery, outbox)
+
+        # The failed message is retried before any message queued after it
+        assert [payload["content"] for _, payload in discord.messages] == [
+            "first",
+            "second",
+            "third",
+        ]
+        assert not outbox.counts()
+
+    with_discord(test)
+
+    assert failed == [("first", True)]
+    assert sent == ["first", "second", "third"]
+
+
+def test_rejected_message_is_dropped_and_the_rest_delivered(with_discord):
+    async def test(discord, session, url):
+        discord.fail("1", status=400)
+        outbox = Outbox()
+        delivery = OutboxDelivery(
+            outbox, WebhookBatcher(session, RateLimiter()), base_delay=0.05
+        )
+        delivery.put(url("1"), Message("rejected"))
+        delivery.put(url("1"), Message("accepted"))
+        await drain(delivery, outbox)
+
+        assert discord.messages == [("1", {"content": "accepted"})]
+        assert not outbox.counts()
+
+    with_discord(test)
+
+
+def test_queued_messages_survive_a_restart(tmp_path, with_discord):
+    path = str(tmp_path / "outbox.sqlite3")
+
+    async def test(discord, session, url):
+        outbox = Outbox(path)
+        outbox.put(url("1"), image_message("first", 10), "first")
+        outbox.put(url("1"), image_message("second", 10), "second")
+        outbox.close()
+
+        # A new process picks the messages up where the last one stopped
+        outbox = Outbox(path)
+        delivery = OutboxDelivery(outbox, WebhookBatcher(session, RateLimiter()))
+        delivery.start()
+        await drain(delivery, outbox)
+        outbox.close()
+
+        assert [
+            (payload["content"], payload["files"]) for _, payload in discord.messages
+        ] == [("first", ["first.webp"]), ("second", ["second.webp"])]
+
+    with_discord(test)
+
+
+def test_pending_is_limited_by_the_size_of_its_media():
+    outbox = Outbox()
+    url = "https://discord.com/api/webhooks/123/token"
+    for label in ["a", "b", "c"]:
+        outbox.put(url, image_message(label, 1000), label)
+
+    assert [entry.label for entry in outbox.pending(url, max_bytes=2500)] == ["a", "b"]
+    assert [entry.label for entry in outbox.pending(url, limit=1)] == ["a"]
+
+    # A message larger than the limit is still returned on its own
+    assert [entry.label for entry in outbox.pending(url, max_bytes=10)] == ["a"]
+
+
+def test_media_shared_by_webhooks_is_stored_once():
+    outbox = Outbox()
+    message = image_message("post", 1000)
+    first = outbox.put("https://discord.com/api/webhooks/1/token", message)
+    outbox.put("https://discord.com/api/webhooks/2/token", message)
+
+    (count,) = outbox.connection.execute("SELECT COUNT(*) FROM blobs").fetchone()
+    assert count == 1
+
+    # The media is kept until the last message using it is removed
+    outbox.remove([first])
+    (count,) = outbox.connection.execute("SELECT COUNT(*) FROM blobs").fetchone()
+    assert count == 1
+
+
+def test_messages_queued_during_the_batch_delay_are_merged(with_discord):
+    async def test(discord, session, url):
+        outbox = Outbox()
+        delivery = OutboxDelivery(
+            outbox, WebhookBatcher(session, RateLimiter(), batch_delay=0.2)
+        )
+        for label in ["first", "second", "third"]:
+            delivery.put(url("1"), Message(label), label)
+            await asyncio.sleep(0.01)
+        await drain(delivery, outbox)
+
+        assert discord.messages == [("1", {"content": "first\nsecond\nthird"})]
+
+    with_discord(test)
+
+
+def test_messages_delivered_in_a_round_are_reported_together(with_discord):
+    rounds = []
+
+    async def test(discord, session, url):
+        outbox = Outbox()
+        delivery = OutboxDelivery(
+            outbox,
+            WebhookBatcher(session, RateLimiter(), batch_delay=0.2),
+            on_round_sent=lambda entries: rounds.append(
+                [entry.label for entry in entries]
+            ),
+        )
+        for label in ["first", "second", "third"]:
+            delivery.put(url("1"), Message(label), label)
+        await drain(delivery, outbox)
+
+    with_discord(test)
+
+    assert rounds == [["first", "second", "third"]]
@@ -0,0 +1,89 @@
+"""Tests for the shared scheduler."""
+
+import asyncio
+import time
+
+from instawebhooks.scheduler import AdaptiveInterval, Scheduler
+
+
+async def run_for(scheduler: Scheduler, seconds: float):
+    """Run a scheduler for a while, then stop it"""
+
+    try:
+        await asyncio.wait_for(scheduler.run(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def test_failing_job_does_not_stop_other_jobs():
+    runs = {"failing": 0, "working": 0}
+    errors = []
+
+    async def failing():
+        runs["failing"] += 1
+        raise TimeoutError
+
+    async def working():
+        runs["working"] += 1
+
+    async def main():
+        scheduler = Scheduler(
+            0.02, on_error=lambda name, error: errors.append((name, error))
+        )
+        scheduler.add("failing", failing)
+        scheduler.add("working", working)
+        await run_for(scheduler, 0.2)
+
+    asyncio.run(main())
+
+    # The failing job is retried at its interval instead of stopping the scheduler
+    assert runs["failing"] > 1
+    assert runs["working"] > 1
+    assert len(errors) == runs["failing"]
+    assert all(name == "failing" for name, _ in errors)
+    assert all(isinstance(error, TimeoutError) for _, error in errors)
+
+
+def test_slow_job_never_overlaps_with_itself():
+    running = 0
+    overlaps = 0
+
+    async def slow():
+        nonlocal running, overlaps
+        running += 1
+        overlaps += running > 1
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    async def main():
+        scheduler = Scheduler(0)
+        scheduler.add("slow", slow)
+        await run_for(scheduler, 0.2)
+
+    asyncio.run(main())
+
+    assert overlaps == 0
+
+
+def test_adaptive_interval_checks_frequent_posters_more_often():
+    now = time.time()
+    interval = AdaptiveInterval(requests_per_hour=20, min_interval=60)
+
+    # Posts every two hours, with one post from years ago among them
+    interval.record("frequent", [now - 3 * 365 * 86400])
+    interval.record("frequent", [now - hours * 3600 for hours in range(1, 20, 2)])
+    interval.record("weekly", [now - weeks * 7 * 86400 - 3600 for weeks in range(10)])
+
+    assert interval("frequent") < interval("weekly")
+    assert interval.activity("frequent", now) > 10 * interval.activity("weekly", now)
+
+
+def test_adaptive_interval_backs_off_from_dormant_accounts():
+    now = time.time()
+    interval = AdaptiveInterval(requests_per_hour=20, min_interval=60)
+
+    # Used to post every two hours, but has been silent for a month
+    interval.record("dormant", [now - 30 * 86400 - hours * 3600 for hours in range(10)])
+    interval.record("active", [now - hours * 7200 for hours in range(1, 10)])
+
+    assert interval.activity("dormant", now) < interval.activity("active", now) / 100
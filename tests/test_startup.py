@@ -0,0 +1,30 @@
+"""Tests for the modules imported when the command starts."""
+
+import subprocess
+import sys
+
+HEAVY_MODULES = ["aiohttp", "asyncio", "discord", "instaloader", "importlib.metadata"]
+
+
+def imported_modules(*args: str):
+    """Run the command and return the modules it imported"""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "instawebhooks", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines of -X importtime end with the name of the module, after a "|"
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "|" in line
+    }
+
+
+def test_version_does_not_import_heavy_modules():
+    modules = imported_modules("--version")
+
+    assert "instawebhooks.parser" in modules
+    assert not modules & set(HEAVY_MODULES)
@@ -0,0 +1,100 @@
+"""Tests for webhook delivery and rate limiting against a fake Discord server."""
+
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from instawebhooks.ratelimit import RateLimiter
+from instawebhooks.webhook import Message, WebhookError, execute_webhook
+
+
+def test_message_is_sent_as_json(with_discord):
+    async def test(discord, session, url):
+        await execute_webhook(session, url("1"), Message("New post"), RateLimiter())
+        assert discord.messages == [("1", {"content": "New post"})]
+
+    with_discord(test)
+
+
+def test_exhausted_bucket_waits_for_reset_after(with_discord):
+    async def test(discord, session, url):
+        discord.script(
+            "1",
+            web.Response(
+                status=204,
+                headers={
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset-After": "0.3",
+                },
+            ),
+        )
+        limiter = RateLimiter()
+        await execute_webhook(session, url("1"), Message("first"), limiter)
+        await execute_webhook(session, url("1"), Message("second"), limiter)
+
+        (_, first), (_, second) = discord.requests
+        assert second - first >= 0.3
+
+    with_discord(test)
+
+
+def test_rate_limited_request_is_retried_after_retry_after(with_discord):
+    async def test(discord, session, url):
+        discord.rate_limit("1", 0.3)
+        await execute_webhook(session, url("1"), Message("New post"), RateLimiter())
+
+        (_, first), (_, second) = discord.requests
+        assert second - first >= 0.3
+
+    with_discord(test)
+
+
+def test_global_rate_limit_blocks_every_webhook(with_discord):
+    async def test(discord, session, url):
+        discord.rate_limit("1", 0.3, is_global=True)
+        limiter = RateLimiter()
+
+        # Another webhook sent to while the first one is limited has to wait too
+        first = asyncio.ensure_future(
+            execute_webhook(session, url("1"), Message("limited"), limiter)
+        )
+        await asyncio.sleep(0.05)
+        await execute_webhook(session, url("2"), Message("second"), limiter)
+        await first
+
+        (_, limited_at), *retries = discord.requests
+        assert sorted(webhook_id for webhook_id, _ in retries) == ["1", "2"]
+        assert all(at - limited_at >= 0.3 for _, at in retries)
+
+    with_discord(test)
+
+
+def test_rate_limit_of_one_webhook_does_not_block_others(with_discord):
+    async def test(discord, session, url):
+        discord.rate_limit("1", 0.5)
+        limiter = RateLimiter()
+
+        await execute_webhook(session, url("2"), Message("warm up"), limiter)
+        first = asyncio.ensure_future(
+            execute_webhook(session, url("1"), Message("limited"), limiter)
+        )
+        await asyncio.sleep(0.05)
+        started = asyncio.get_running_loop().time()
+        await execute_webhook(session, url("2"), Message("free"), limiter)
+
+        assert asyncio.get_running_loop().time() - started < 0.3
+        await first
+
+    with_discord(test)
+
+
+def test_rejected_message_raises_webhook_error(with_discord):
+    async def test(discord, session, url):
+        discord.script("1", web.Response(status=400, text="Invalid Form Body"))
+
+        with pytest.raises(WebhookError) as error:
+            await execute_webhook(session, url("1"), Message("New post"))
+        assert error.value.status == 400
+
+    with_discord(test)